@@ -0,0 +1,107 @@
+"""
+Runs the benchmark suite against a local stand-in server
+
+eg:
+
+python -m benchmarks --urls 10000 100000 1000000 --output bench.json
+python -m benchmarks --only scrape fetch_all --compare bench.json
+"""
+from typing import Any, Dict, List
+
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+from .server import start_server
+from .suite import SCENARIOS, run_scenario
+
+
+# The higher the better, compared between runs
+THROUGHPUTS = ('requests_per_second', 'megabytes_per_second', 'documents_per_second')
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('--only', nargs='+', choices=sorted(SCENARIOS), default=sorted(SCENARIOS),
+                        help='scenarios to run, all by default')
+    parser.add_argument('--urls', nargs='+', type=int, default=[10000, 100000],
+                        help='url counts for the fetch scenarios')
+    parser.add_argument('--output', default='bench.json',
+                        help='where to write the results, as json')
+    parser.add_argument('--compare', metavar='PREVIOUS',
+                        help='results of a previous run to compare against')
+    args = parser.parse_args(argv)
+
+    process, base_url = start_server()
+    try:
+        results = [
+            _run(name, base_url, **params)
+            for name in args.only
+            for params in _params(name, args.urls)
+        ]
+    finally:
+        process.terminate()
+
+    report = {**_environment(), 'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            _compare(json.load(f), report)
+
+
+def _params(name: str, urls: List[int]) -> List[Dict[str, Any]]:
+    if name.startswith('fetch_all'):
+        return [{'urls': count} for count in urls]
+    return [{}]
+
+
+def _run(name: str, base_url: str, **params: Any) -> Dict[str, Any]:
+    # A fresh process per run, so peak memory is that run's alone
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        result = pool.submit(run_scenario, name, base_url, **params).result()
+
+    result = {'scenario': name, 'params': params, **result}
+    print(json.dumps(result), file=sys.stderr)
+    return result
+
+
+def _environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'timestamp' : time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit'    : commit,
+        'python'    : platform.python_version(),
+        'platform'  : platform.platform(),
+    }
+
+
+def _compare(previous: Dict[str, Any], current: Dict[str, Any]) -> None:
+    def key(result: Dict[str, Any]) -> str:
+        return json.dumps([result['scenario'], result['params']], sort_keys=True)
+
+    before = {key(result): result for result in previous['results']}
+
+    for result in current['results']:
+        old = before.get(key(result))
+        if old is None:
+            continue
+        for metric in THROUGHPUTS:
+            if metric in result and old.get(metric):
+                change = result[metric] / old[metric] - 1
+                print(f"{result['scenario']} {result['params']} {metric}: "
+                      f"{old[metric]:.1f} -> {result[metric]:.1f} ({change:+.1%})")
+
+
+if __name__ == '__main__':
+    main()
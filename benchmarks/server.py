@@ -0,0 +1,113 @@
+from typing import Dict, Tuple
+
+import time
+import random
+import socket
+import asyncio
+from multiprocessing import Process
+
+from aiohttp import web  # type: ignore
+
+
+__all__ = [
+    'make_app', 'start_server',
+]
+
+
+CHUNK_SIZE = 2 ** 16
+
+
+def make_app() -> web.Application:
+    """
+    Stand-in server, every response is shaped by the query string:
+
+    /bytes/<size>?latency=0.01&chunked=1&errors=0.05&rate=1000
+
+    'latency' seconds before answering, 'chunked' transfer encoding,
+    'errors' fraction of 500s, and over 'rate' requests/s (shared by
+    every throttled url) a 429 with 'Retry-After: 0'
+    """
+    bodies : Dict[int, bytes] = {}
+    bucket = {'tokens': 0.0, 'updated': time.monotonic()}
+
+    def body(size: int) -> bytes:
+        if size not in bodies:
+            bodies[size] = b'x' * size
+        return bodies[size]
+
+    def throttled(rate: float) -> bool:
+        now = time.monotonic()
+        bucket['tokens']  = min(rate, bucket['tokens'] + (now - bucket['updated']) * rate)
+        bucket['updated'] = now
+        if bucket['tokens'] < 1:
+            return True
+        bucket['tokens'] -= 1
+        return False
+
+    async def handle(request: web.Request) -> web.StreamResponse:
+        size    = int(request.match_info['size'])
+        query   = request.query
+        latency = float(query.get('latency', 0))
+
+        if latency:
+            await asyncio.sleep(latency)
+
+        if 'rate' in query and throttled(float(query['rate'])):
+            return web.Response(status=429, headers={'Retry-After': '0'})
+
+        if random.random() < float(query.get('errors', 0)):
+            return web.Response(status=500)
+
+        if not query.get('chunked'):
+            return web.Response(body=body(size))
+
+        response = web.StreamResponse()
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        chunk = body(min(size, CHUNK_SIZE))
+        for start in range(0, size, CHUNK_SIZE):
+            await response.write(chunk[:size - start])
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_get('/bytes/{size}', handle)
+    return app
+
+
+def _serve(sock: socket.socket) -> None:
+    web.run_app(make_app(), sock=sock, print=None, access_log=None)
+
+
+def start_server(host: str = '127.0.0.1') -> Tuple[Process, str]:
+    """
+    Serves 'make_app' from a separate process, so it doesn't compete
+    with the benchmark for the event loop, returns it and its base url
+    """
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, 0))
+    port = sock.getsockname()[1]
+
+    process = Process(target=_serve, args=(sock,), daemon=True)
+    process.start()
+    sock.close()
+
+    _wait_listening(host, port)
+    return process, f'http://{host}:{port}'
+
+
+def _wait_listening(host: str, port: int, timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+if __name__ == '__main__':
+    web.run_app(make_app())
@@ -0,0 +1,151 @@
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import os
+import sys
+import time
+import tempfile
+from urllib.parse import urlencode
+
+from scrapetools.download import download
+from scrapetools.fetch import fetch
+from scrapetools.metrics import Metrics
+from scrapetools.retry import Retry
+from scrapetools.scrape import scrape, scrape_all
+from scrapetools.util import run
+
+
+__all__ = [
+    'SCENARIOS', 'run_scenario',
+    'bench_fetch_all', 'bench_download_all', 'bench_scrape', 'peak_rss',
+]
+
+
+def bench_fetch_all(base_url       : str,
+                    urls           : int   = 10000,
+                    size           : int   = 256,
+                    latency        : float = 0,
+                    errors         : float = 0,
+                    rate           : float = None,
+                    chunked        : bool  = False,
+                    max_concurrent : int   = 1000,
+                    ) -> Dict[str, Any]:
+    options = _query(latency=latency, errors=errors, rate=rate, chunked=chunked)
+    targets = [f'{base_url}/bytes/{size}?i={i}{options}' for i in range(urls)]
+
+    # Injected errors and throttling are there to exercise the retries
+    retry   = Retry(attempts=10, backoff=0.01) if errors or rate else None
+    metrics = Metrics()
+
+    started   = time.perf_counter()
+    responses = run(fetch(targets,
+                          max_concurrent=max_concurrent,
+                          retry=retry,
+                          metrics=metrics))
+    seconds   = time.perf_counter() - started
+
+    latency_quantiles = metrics.snapshot()['latency']
+    return {
+        'seconds'             : seconds,
+        'requests_per_second' : urls / seconds,
+        'failed'              : sum(response.error is not None for response in responses),
+        'latency_p50'         : latency_quantiles['p50'],
+        'latency_p99'         : latency_quantiles['p99'],
+        'peak_rss'            : peak_rss(),
+    }
+
+
+def bench_download_all(base_url       : str,
+                       files          : int  = 20,
+                       size           : int  = 2 ** 24,
+                       chunked        : bool = False,
+                       max_concurrent : int  = 5,
+                       ) -> Dict[str, Any]:
+    options = _query(chunked=chunked)
+
+    with tempfile.TemporaryDirectory() as directory:
+        targets = {
+            f'{base_url}/bytes/{size}?i={i}{options}': os.path.join(directory, str(i))
+            for i in range(files)
+        }
+
+        started = time.perf_counter()
+        run(download(targets, max_concurrent=max_concurrent))
+        seconds = time.perf_counter() - started
+
+        sizes = [
+            os.path.getsize(path) if os.path.exists(path) else 0
+            for path in targets.values()
+        ]
+
+    return {
+        'seconds'              : seconds,
+        'megabytes_per_second' : sum(sizes) / seconds / 2 ** 20,
+        'failed'               : sum(written != size for written in sizes),
+        'peak_rss'             : peak_rss(),
+    }
+
+
+def bench_scrape(documents : int  = 200,
+                 links     : int  = 1000,
+                 batch     : bool = False,
+                 ) -> Dict[str, Any]:
+    document = '<html><body><ul>{}</ul></body></html>'.format(''.join(
+        f'<li><a href="/page/{i}">Page {i}</a></li>' for i in range(links)
+    ))
+
+    started = time.perf_counter()
+    if batch:
+        scrape_all([document] * documents, {'links': ('li a', '@href')})
+    else:
+        for _ in range(documents):
+            scrape(document, css='li a', xpath='@href')
+    seconds = time.perf_counter() - started
+
+    return {
+        'seconds'              : seconds,
+        'documents_per_second' : documents / seconds,
+        'peak_rss'             : peak_rss(),
+    }
+
+
+def peak_rss() -> Optional[int]:
+    """Peak resident memory of this process, in bytes"""
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes everywhere but on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _query(**options: Any) -> str:
+    options = {key: int(value) if isinstance(value, bool) else value
+               for key, value in options.items() if value}
+    return '&' + urlencode(options) if options else ''
+
+
+# name: (function, whether it needs the server, default params)
+SCENARIOS : Dict[str, Tuple[Callable[..., Dict[str, Any]], bool, Dict[str, Any]]] = {
+    'fetch_all'            : (bench_fetch_all, True, {}),
+    'fetch_all_chunked'    : (bench_fetch_all, True, {'chunked': True}),
+    'fetch_all_faulty'     : (bench_fetch_all, True, {'latency': 0.01, 'errors': 0.01}),
+    'fetch_all_throttled'  : (bench_fetch_all, True, {'rate': 500}),
+    'download_all'         : (bench_download_all, True, {}),
+    'download_all_chunked' : (bench_download_all, True, {'chunked': True}),
+    'scrape'               : (bench_scrape, False, {}),
+    'scrape_all'           : (bench_scrape, False, {'batch': True}),
+}
+
+
+def run_scenario(name     : str,
+                 base_url : str = None,
+                 **params : Any,
+                 ) -> Dict[str, Any]:
+    bench, needs_server, defaults = SCENARIOS[name]
+
+    params = {**defaults, **params}
+    if needs_server:
+        return bench(base_url, **params)
+    return bench(**params)
@@ -1,4 +1,4 @@
 from .fmap import fmap # NOQA
 from .scrape import scrape # NOQA
-from .fetch import fetch, fetch_sync # NOQA
+from .fetch import fetch, fetch_sync, fetch_iter, fetch_iter_sync # NOQA
 from .download import download, download_sync # NOQA
@@ -0,0 +1,161 @@
+from typing import Any, Awaitable, Deque, Optional, Tuple, Type, TypeVar, Union
+
+import time
+import asyncio
+from collections import deque
+
+from .errors import StatusError
+from .response import Response
+
+
+A = TypeVar('A')
+
+
+__all__ = [
+    'AdaptiveLimiter', 'limit_of', 'measured',
+]
+
+
+CONGESTION_EXCEPTIONS : Tuple[Type[BaseException], ...] = (
+    asyncio.TimeoutError,
+)
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit that adapts to the target (AIMD)
+
+    Every healthy request grows the limit by '1 / limit', about one
+    per round of requests, while timeouts, 429 and 5xx responses
+    (and requests slower than 'max_latency', if given) multiply it
+    by 'decrease', at most once per round trip
+
+    Works as a drop in for 'asyncio.Semaphore', and as 'max_concurrent'
+    for 'fetch' and 'download', 'limit' is the current window
+
+    eg:
+
+    limiter = AdaptiveLimiter(initial=20, max_limit=2000)
+    await fetch(urls, max_concurrent=limiter)
+    limiter.limit
+    """
+
+    def __init__(self,
+                 initial     : int   = 10,
+                 min_limit   : int   = 1,
+                 max_limit   : int   = 1000,
+                 decrease    : float = 0.5,
+                 max_latency : float = None,
+                 ) -> None:
+        self.min_limit   = min_limit
+        self.max_limit   = max_limit
+        self.decrease    = decrease
+        self.max_latency = max_latency
+
+        self._limit         = float(initial)
+        self._active        = 0
+        self._waiters       : Deque[asyncio.Future] = deque()
+        self._latency       : Optional[float] = None
+        self._last_decrease = 0.0
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def latency(self) -> Optional[float]:
+        """Smoothed latency of the recorded requests"""
+        return self._latency
+
+    def congested(self, latency: float, error: BaseException = None) -> bool:
+        if isinstance(error, StatusError):
+            return error.status == 429 or error.status >= 500
+        if isinstance(error, CONGESTION_EXCEPTIONS):
+            return True
+        return self.max_latency is not None and latency > self.max_latency
+
+    def record(self,
+               latency : float,
+               error   : BaseException = None,
+               ) -> None:
+        if self._latency is None:
+            self._latency = latency
+        else:
+            self._latency += (latency - self._latency) / 8
+
+        if self.congested(latency, error):
+            now = time.monotonic()
+            # Requests of the same round see the same congestion
+            if now - self._last_decrease >= self._latency:
+                self._limit = max(self.min_limit, self._limit * self.decrease)
+                self._last_decrease = now
+        elif error is None:
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+            self._wake()
+
+    async def measure(self, awaitable: Awaitable[A]) -> A:
+        """Awaits 'awaitable' and records its latency and outcome"""
+        started = time.monotonic()
+        try:
+            result = await awaitable
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            self.record(time.monotonic() - started, error)
+            raise
+
+        failure = result.error if isinstance(result, Response) else None
+        self.record(time.monotonic() - started, failure)
+        return result
+
+    async def acquire(self) -> None:
+        if self._active < self.limit and not self._waiters:
+            self._active += 1
+            return
+
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self) -> None:
+        self._active -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self._active < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._active += 1
+                waiter.set_result(None)
+
+    async def __aenter__(self) -> None:
+        await self.acquire()
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        self.release()
+
+
+def limit_of(max_concurrent: Union[int, AdaptiveLimiter]) -> int:
+    if isinstance(max_concurrent, AdaptiveLimiter):
+        return max_concurrent.limit
+    return max_concurrent
+
+
+def measured(max_concurrent : Union[int, AdaptiveLimiter],
+             awaitable      : Awaitable[A],
+             ) -> Awaitable[A]:
+    """Feeds 'awaitable' back to 'max_concurrent' if it is adaptive"""
+    if isinstance(max_concurrent, AdaptiveLimiter):
+        return max_concurrent.measure(awaitable)
+    return awaitable
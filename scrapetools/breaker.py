@@ -0,0 +1,117 @@
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type, TypeVar
+
+import time
+import asyncio
+
+import aiohttp  # type: ignore
+
+from .errors import StatusError, CircuitOpenError
+from .util import url_host
+
+
+A = TypeVar('A')
+
+
+__all__ = [
+    'CircuitBreaker',
+]
+
+
+HOST_EXCEPTIONS : Tuple[Type[BaseException], ...] = (
+    aiohttp.ClientConnectionError,
+    asyncio.TimeoutError,
+)
+
+
+class _Circuit:
+    def __init__(self) -> None:
+        self.failures  = 0
+        self.opened_at : Optional[float] = None
+        self.probing   = False
+
+
+class CircuitBreaker:
+    """
+    Per host circuit breaker
+
+    After 'failures' consecutive host failures (connection errors,
+    timeouts, 429 and 5xx statuses) requests to that host fail fast with
+    'CircuitOpenError' instead of taking a slot for the full timeout.
+    Once 'cooldown' seconds pass a single probe request goes through,
+    closing the circuit on success and reopening it on failure
+
+    eg:
+
+    await fetch(urls, breaker=CircuitBreaker(failures=5, cooldown=30))
+    """
+
+    def __init__(self,
+                 failures : int   = 5,
+                 cooldown : float = 30,
+                 ) -> None:
+        self.failures = failures
+        self.cooldown = cooldown
+
+        self._circuits : Dict[str, _Circuit] = {}
+
+    def is_open(self, url: str) -> bool:
+        circuit = self._circuits.get(url_host(url))
+        return circuit is not None and circuit.opened_at is not None
+
+    def host_failure(self, error: BaseException) -> bool:
+        if isinstance(error, StatusError):
+            return error.status == 429 or error.status >= 500
+        return isinstance(error, HOST_EXCEPTIONS)
+
+    def before(self, url: str) -> None:
+        """Raises 'CircuitOpenError' unless a request to 'url' may go"""
+        host    = url_host(url)
+        circuit = self._circuits.get(host)
+        if circuit is None or circuit.opened_at is None:
+            return
+
+        remaining = circuit.opened_at + self.cooldown - time.monotonic()
+        if remaining > 0 or circuit.probing:
+            raise CircuitOpenError(host, max(remaining, 0))
+
+        # Half open, let this one request probe the host
+        circuit.probing = True
+
+    def success(self, url: str) -> None:
+        self._circuits.pop(url_host(url), None)
+
+    def failure(self, url: str) -> None:
+        circuit = self._circuits.setdefault(url_host(url), _Circuit())
+        circuit.failures += 1
+
+        if circuit.probing or circuit.failures >= self.failures:
+            circuit.opened_at = time.monotonic()
+            circuit.probing   = False
+
+    async def call(self,
+                   url      : str,
+                   f        : Callable[..., Awaitable[A]],
+                   *args    : Any,
+                   **kwargs : Any,
+                   ) -> A:
+        self.before(url)
+        try:
+            result = await f(*args, **kwargs)
+        except asyncio.CancelledError:
+            self._release_probe(url)
+            raise
+        except Exception as error:
+            if self.host_failure(error):
+                self.failure(url)
+            else:
+                # The host answered, it is alive
+                self.success(url)
+            raise
+
+        self.success(url)
+        return result
+
+    def _release_probe(self, url: str) -> None:
+        circuit = self._circuits.get(url_host(url))
+        if circuit is not None:
+            circuit.probing = False
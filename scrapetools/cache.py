@@ -0,0 +1,244 @@
+from typing import Any, Dict, Mapping, Optional
+
+import os
+import time
+import sqlite3
+from email.utils import parsedate_to_datetime
+
+from .util import normalize_url
+
+
+__all__ = [
+    'Cache', 'CacheEntry',
+]
+
+
+class CacheEntry:
+    def __init__(self,
+                 url           : str,
+                 body          : bytes,
+                 encoding      : str   = None,
+                 etag          : str   = None,
+                 last_modified : str   = None,
+                 expires       : float = None,
+                 ) -> None:
+        self.url           = url
+        self.body          = body
+        self.encoding      = encoding
+        self.etag          = etag
+        self.last_modified = last_modified
+        self.expires       = expires
+
+    @property
+    def fresh(self) -> bool:
+        return self.expires is not None and self.expires > time.time()
+
+    @property
+    def text(self) -> str:
+        return self.body.decode(self.encoding or 'utf-8', errors='replace')
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class Cache:
+    """
+    Persistent HTTP response cache stored in a sqlite file
+
+    Entries are keyed on the normalized url, stale entries are
+    revalidated with 'If-None-Match'/'If-Modified-Since' and the least
+    recently used ones are evicted once 'max_size' bytes is exceeded
+
+    'ttl' overrides the freshness lifetime the server advertises
+
+    Writes and access times are committed every 'batch' changes
+    (and on 'close'), the total size is kept in memory, so the table
+    is only scanned when something has to be evicted
+
+    eg:
+
+    cache = Cache('~/.cache/scrapetools.sqlite', max_size=2 ** 30)
+    await fetch(urls, cache=cache)
+    """
+
+    def __init__(self,
+                 path     : str   = 'scrapetools-cache.sqlite',
+                 max_size : int   = None,
+                 ttl      : float = None,
+                 batch    : int   = 100,
+                 ) -> None:
+        self.path     = os.path.expanduser(path)
+        self.max_size = max_size
+        self.ttl      = ttl
+        self.batch    = batch
+
+        # Access times not written yet, by key
+        self._accessed : Dict[str, float] = {}
+        self._pending  = 0
+
+        self._db = sqlite3.connect(self.path)
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                key           TEXT PRIMARY KEY,
+                url           TEXT,
+                body          BLOB,
+                encoding      TEXT,
+                etag          TEXT,
+                last_modified TEXT,
+                expires       REAL,
+                size          INTEGER,
+                accessed      REAL
+            )
+        ''')
+        self._db.execute('''
+            CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)
+        ''')
+        self._db.commit()
+
+        self._size, = self._db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM entries'
+        ).fetchone()
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        key = normalize_url(url)
+        row = self._db.execute('''
+            SELECT url, body, encoding, etag, last_modified, expires
+            FROM entries WHERE key = ?
+        ''', (key,)).fetchone()
+
+        if row is None:
+            return None
+
+        self._accessed[key] = time.time()
+        self._changed()
+        return CacheEntry(*row)
+
+    def put(self,
+            url      : str,
+            body     : bytes,
+            headers  : Mapping[str, str],
+            encoding : str = None,
+            ) -> None:
+        if 'no-store' in _cache_control(headers.get('Cache-Control', '')):
+            return
+
+        key = normalize_url(url)
+        old = self._db.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+
+        self._db.execute('''
+            INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            key,
+            url,
+            body,
+            encoding,
+            headers.get('ETag'),
+            headers.get('Last-Modified'),
+            self._expires(headers),
+            len(body),
+            time.time(),
+        ))
+        self._accessed.pop(key, None)
+        self._size += len(body) - (old[0] if old else 0)
+
+        self._changed()
+        self.evict()
+
+    def refresh(self,
+                url     : str,
+                headers : Mapping[str, str],
+                ) -> None:
+        """Extends the lifetime of an entry after a 304 revalidation"""
+        self._db.execute('UPDATE entries SET expires = ? WHERE key = ?',
+                         (self._expires(headers), normalize_url(url)))
+        self._changed()
+
+    def evict(self) -> None:
+        if self.max_size is None or self._size <= self.max_size:
+            return
+
+        # Least recently used first, pending access times included
+        self._write_accessed()
+        total = self._size
+        rows  = self._db.execute(
+            'SELECT key, size FROM entries ORDER BY accessed'
+        )
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_size:
+                break
+            evicted.append((key,))
+            total -= size
+
+        self._db.executemany('DELETE FROM entries WHERE key = ?', evicted)
+        self._size = total
+        self.commit()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        count, = self._db.execute('SELECT COUNT(*) FROM entries').fetchone()
+        return count
+
+    def clear(self) -> None:
+        self._accessed.clear()
+        self._db.execute('DELETE FROM entries')
+        self._size = 0
+        self.commit()
+
+    def commit(self) -> None:
+        self._write_accessed()
+        self._db.commit()
+        self._pending = 0
+
+    def close(self) -> None:
+        self.commit()
+        self._db.close()
+
+    def _changed(self, force: bool = False) -> None:
+        self._pending += 1
+        if force or self._pending >= self.batch:
+            self.commit()
+
+    def _write_accessed(self) -> None:
+        if self._accessed:
+            self._db.executemany('UPDATE entries SET accessed = ? WHERE key = ?',
+                                 [(accessed, key) for key, accessed in self._accessed.items()])
+            self._accessed.clear()
+
+    def _expires(self, headers: Mapping[str, str]) -> Optional[float]:
+        if self.ttl is not None:
+            return time.time() + self.ttl
+
+        directives = _cache_control(headers.get('Cache-Control', ''))
+        if 'no-cache' in directives or 'no-store' in directives:
+            return None
+        if 'max-age' in directives:
+            try:
+                return time.time() + int(directives['max-age'])
+            except ValueError:
+                return None
+
+        if 'Expires' in headers:
+            try:
+                return parsedate_to_datetime(headers['Expires']).timestamp()
+            except (TypeError, ValueError):
+                return None
+
+        return None
+
+
+def _cache_control(value: str) -> Dict[str, Any]:
+    directives : Dict[str, Any] = {}
+    for directive in value.split(','):
+        name, _, argument = directive.strip().partition('=')
+        if name:
+            directives[name.lower()] = argument.strip('"') or True
+    return directives
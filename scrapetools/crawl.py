@@ -0,0 +1,394 @@
+from typing import (
+    Any, AsyncIterator, Callable, Deque, Dict, Iterable, Iterator,
+    List, Tuple, Union,
+)
+import os
+import math
+import asyncio
+import hashlib
+import sqlite3
+from collections import deque
+from concurrent.futures import Executor
+
+import aiohttp  # type: ignore
+from lxml import etree  # type: ignore
+
+from .adaptive import AdaptiveLimiter, limit_of
+from .breaker import CircuitBreaker
+from .cache import Cache
+from .fetch import fetch_iter
+from .metrics import Metrics
+from .ratelimit import RateLimiter
+from .response import Response
+from .retry import Retry
+from .scrape import _parsed, _select
+from .util import normalize_url, run_iter, url_host
+from .warc import WarcWriter
+
+
+__all__ = [
+    'crawl', 'crawl_sync', 'extract_links',
+    'Frontier', 'BloomFilter',
+]
+
+
+QUEUED, FETCHING, DONE = 0, 1, 2
+
+
+class BloomFilter:
+    """
+    Compact set of strings, sized for 'capacity' items with a
+    'error_rate' chance of false positives once full, (about 18MB
+    for 10 million urls at 0.1%), items can't be listed or removed
+
+    eg:
+
+    seen = BloomFilter(capacity=10 ** 7)
+    seen.add(url)  # True if it wasn't there yet
+    url in seen
+    """
+
+    def __init__(self,
+                 capacity   : int = 10 ** 7,
+                 error_rate : float = 1e-3,
+                 ) -> None:
+        self.capacity   = capacity
+        self.error_rate = error_rate
+
+        self.size   = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits  = bytearray((self.size + 7) // 8)
+        self._count = 0
+
+    def add(self, item: str) -> bool:
+        new = False
+        for bit in self._positions(item):
+            byte, mask = bit >> 3, 1 << (bit & 7)
+            if not self._bits[byte] & mask:
+                self._bits[byte] |= mask
+                new = True
+
+        self._count += new
+        return new
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[bit >> 3] & (1 << (bit & 7))
+                   for bit in self._positions(item))
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _positions(self, item: str) -> Iterator[int]:
+        # Double hashing, 'hashes' positions out of a single digest
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first  = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+
+class Frontier:
+    """
+    Crawl queue stored in a sqlite file, urls are popped lowest
+    'priority' first and kept once fetched, so a crawl picks up where it
+    stopped, urls popped but not marked done by then are fetched again
+
+    Urls already seen are filtered by a 'BloomFilter' in memory, rebuilt
+    from the file on open, before touching the disk, a false positive
+    (about 'error_rate' of them) means a new url is skipped
+
+    eg:
+
+    with Frontier('crawl.sqlite') as frontier:
+        frontier.push(links, depth=1)
+        for url, depth in frontier.pop(100):
+            ...
+        frontier.done(urls)
+    """
+
+    def __init__(self,
+                 path       : str = 'scrapetools-crawl.sqlite',
+                 capacity   : int = 10 ** 7,
+                 error_rate : float = 1e-3,
+                 ) -> None:
+        self.path = os.path.expanduser(path)
+        self.seen = BloomFilter(capacity, error_rate)
+
+        self._db = sqlite3.connect(self.path)
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS frontier (
+                url      TEXT PRIMARY KEY,
+                priority REAL,
+                depth    INTEGER,
+                state    INTEGER
+            )
+        ''')
+        self._db.execute('''
+            CREATE INDEX IF NOT EXISTS frontier_queue ON frontier (state, priority)
+        ''')
+        # Requeue what a previous run was fetching when it stopped
+        self._db.execute('UPDATE frontier SET state = ? WHERE state = ?', (QUEUED, FETCHING))
+        self._db.commit()
+
+        for url, in self._db.execute('SELECT url FROM frontier'):
+            self.seen.add(url)
+
+    def push(self,
+             urls     : Iterable[str],
+             depth    : int = 0,
+             priority : Callable[[str, int], float] = None,
+             ) -> int:
+        """Queues the 'urls' not seen yet, returns how many were new"""
+        rows = [
+            (url, priority(url, depth) if priority else depth, depth, QUEUED)
+            for url in urls
+            if self.seen.add(url)
+        ]
+        self._db.executemany('INSERT OR IGNORE INTO frontier VALUES (?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def pop(self, count: int = 1) -> List[Tuple[str, int]]:
+        """
+        Takes up to 'count' urls and their depths off the queue,
+        in the order they were pushed for equal priorities
+        """
+        rows = self._db.execute('''
+            SELECT url, depth FROM frontier
+            WHERE state = ? ORDER BY priority, rowid LIMIT ?
+        ''', (QUEUED, count)).fetchall()
+
+        self._db.executemany('UPDATE frontier SET state = ? WHERE url = ?',
+                             [(FETCHING, url) for url, _ in rows])
+        self._db.commit()
+        return rows
+
+    def done(self, urls: Iterable[str]) -> None:
+        self._db.executemany('UPDATE frontier SET state = ? WHERE url = ?',
+                             [(DONE, url) for url in urls])
+
+    def commit(self) -> None:
+        self._db.commit()
+
+    def count(self, state: int = QUEUED) -> int:
+        return self._db.execute('SELECT COUNT(*) FROM frontier WHERE state = ?',
+                                (state,)).fetchone()[0]
+
+    def __len__(self) -> int:
+        return self.count(QUEUED)
+
+    def close(self) -> None:
+        self._db.commit()
+        self._db.close()
+
+    def __enter__(self) -> 'Frontier':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def extract_links(document : Union[str, bytes],
+                  base_url : str,
+                  css      : str = 'a[href]',
+                  encoding : str = None,
+                  ) -> List[str]:
+    """
+    Normalized absolute http(s) links in 'document', relative
+    ones resolved against 'base_url' (or the page's <base>) like
+    'scrape' does, without duplicates or fragments
+    """
+    # lxml refuses text with an encoding declaration, bytes always work
+    if isinstance(document, str):
+        document, encoding = document.encode('utf-8'), 'utf-8'
+
+    try:
+        root, resolve = _parsed(document, base_url, encoding)
+    except (etree.ParserError, ValueError):
+        return []
+
+    links = []
+    for href in _select(root, css, '@href', links=resolve):
+        if isinstance(href, str) and href.startswith(('http://', 'https://')):
+            links.append(normalize_url(href))
+    return list(dict.fromkeys(links))
+
+
+def crawl(seeds          : Union[str, Iterable[str]],
+          frontier       : Union[str, Frontier] = 'scrapetools-crawl.sqlite',
+          follow         : Callable[[str], bool] = None,
+          max_pages      : int = None,
+          max_depth      : int = None,
+          priority       : Callable[[str, int], float] = None,
+          links          : str = 'a[href]',
+          batch_size     : int = 1000,
+          session        : aiohttp.ClientSession = None,
+          max_concurrent : Union[int, AdaptiveLimiter] = 100,
+          max_per_host   : int = None,
+          cache          : Cache = None,
+          warc           : WarcWriter = None,
+          executor       : Executor = None,
+          raw            : bool = False,
+          retry          : Retry = None,
+          breaker        : CircuitBreaker = None,
+          rate_limit     : RateLimiter = None,
+          metrics        : Metrics = None,
+          ) -> AsyncIterator[Response]:
+    """
+    Crawls from 'seeds', yielding each page's 'Response' as it
+    completes, and queueing the links matched by the 'links' css
+    selector in the 'frontier', a sqlite file or a 'Frontier'
+
+    Links are followed if 'follow(url)' says so, by default when they
+    are on one of the seeds' hosts, breadth first unless 'priority'
+    (url, depth) -> number says otherwise, lowest first
+
+    Pages are fetched with a single 'fetch_iter' window, refilled from
+    the frontier as requests finish, so a slow page doesn't hold up the
+    others, the frontier is committed every 'batch_size' pages, so
+    rerunning a stopped crawl with the same file continues it, up to
+    'max_pages' in total
+
+    eg:
+
+    async for url, text, error in crawl('https://docs.python.org/3/',
+                                        frontier='python-docs.sqlite'):
+        scrape(text, css='h1')
+    """
+    return _crawl(**locals())
+
+
+def crawl_sync(*args    : Any,
+               **kwargs : Any,
+               ) -> Iterator[Response]:
+    return run_iter(crawl(*args, **kwargs))
+
+
+async def _crawl(seeds          : Union[str, Iterable[str]],
+                 frontier       : Union[str, Frontier] = 'scrapetools-crawl.sqlite',
+                 follow         : Callable[[str], bool] = None,
+                 max_pages      : int = None,
+                 max_depth      : int = None,
+                 priority       : Callable[[str, int], float] = None,
+                 links          : str = 'a[href]',
+                 batch_size     : int = 1000,
+                 session        : aiohttp.ClientSession = None,
+                 max_concurrent : Union[int, AdaptiveLimiter] = 100,
+                 max_per_host   : int = None,
+                 cache          : Cache = None,
+                 warc           : WarcWriter = None,
+                 executor       : Executor = None,
+                 raw            : bool = False,
+                 retry          : Retry = None,
+                 breaker        : CircuitBreaker = None,
+                 rate_limit     : RateLimiter = None,
+                 metrics        : Metrics = None,
+                 ) -> AsyncIterator[Response]:
+    arguments = locals()
+
+    if isinstance(frontier, str):
+        with Frontier(frontier) as opened:
+            arguments.update(frontier=opened)
+            async for response in _crawl(**arguments):
+                yield response
+        return
+
+    if isinstance(seeds, str):
+        seeds = [seeds]
+    seeds = [normalize_url(seed) for seed in seeds]
+
+    if follow is None:
+        hosts = {url_host(seed) for seed in seeds}
+
+        def follow(url: str) -> bool:
+            return url_host(url) in hosts
+
+    frontier.push(seeds, depth=0, priority=priority)
+    frontier.commit()
+
+    loop    = asyncio.get_event_loop()
+    crawled = frontier.count(DONE)
+    feed    = _Feed(frontier,
+                    chunk=limit_of(max_concurrent),
+                    limit=None if max_pages is None else max_pages - crawled)
+
+    # A single window, refilled from the frontier as requests finish,
+    # only restarted when it drained while the frontier was empty
+    while feed.more():
+        responses = fetch_iter(feed,
+                               session=session,
+                               max_concurrent=max_concurrent,
+                               max_per_host=max_per_host,
+                               cache=cache,
+                               warc=warc,
+                               raw=raw,
+                               retry=retry,
+                               breaker=breaker,
+                               rate_limit=rate_limit,
+                               metrics=metrics)
+        try:
+            async for response in responses:
+                depth = feed.depths.pop(response.url)
+
+                if response.error is None and (max_depth is None or depth < max_depth):
+                    found = await loop.run_in_executor(executor,
+                                                       extract_links,
+                                                       response.result,
+                                                       response.url,
+                                                       links,
+                                                       response.encoding)
+                    frontier.push(filter(follow, found), depth + 1, priority)
+
+                frontier.done([response.url])
+                crawled += 1
+                if crawled % batch_size == 0:
+                    frontier.commit()
+                yield response
+        finally:
+            await responses.aclose()  # type: ignore
+            frontier.commit()
+
+
+class _Feed:
+    """
+    Urls popped off 'frontier' as 'fetch_iter' asks for them, 'chunk'
+    at a time and up to 'limit' in total
+
+    It runs dry while the frontier is empty, but 'fetch_iter' asks
+    again once each response is handled, by then its links have been
+    pushed, so the window keeps going instead of draining batch by batch
+    """
+
+    def __init__(self,
+                 frontier : Frontier,
+                 chunk    : int,
+                 limit    : int = None,
+                 ) -> None:
+        self.frontier = frontier
+        self.chunk    = max(1, chunk)
+        self.limit    = limit
+        self.depths   : Dict[str, int] = {}
+
+        self._queued : Deque[Tuple[str, int]] = deque()
+
+    def more(self) -> bool:
+        if self._queued:
+            return True
+        return (self.limit is None or self.limit > 0) and len(self.frontier) > 0
+
+    def __iter__(self) -> '_Feed':
+        return self
+
+    def __next__(self) -> str:
+        if not self._queued:
+            count = self.chunk if self.limit is None else min(self.chunk, self.limit)
+            if count > 0:
+                popped = self.frontier.pop(count)
+                self._queued.extend(popped)
+                if self.limit is not None:
+                    self.limit -= len(popped)
+
+        if not self._queued:
+            raise StopIteration
+
+        url, depth = self._queued.popleft()
+        self.depths[url] = depth
+        return url
@@ -1,41 +1,72 @@
 from typing import (
     Union, Iterable, Awaitable, Any,
-    Iterable, Dict, Tuple,
+    Iterable, Dict, Tuple, AsyncIterator,
+    List, Optional, Callable,
 )
 import os
 import asyncio
+from functools import partial
 
 import aiohttp  # type: ignore
-from tqdm import tqdm  # type: ignore
 
-from .fetch import bar_options
+from .adaptive import AdaptiveLimiter, measured
+from .breaker import CircuitBreaker
+from .errors import check_status
+from .metrics import Metrics, MetricsBar
+from .ratelimit import RateLimiter
+from .resume import PartFile
+from .response import Response
+from .retry import Retry
+from .schedule import HostScheduler
+from .session import get_session
+from .timing import Timings
 from .util import run, sensible_download_path
+from .writer import FileWriter, allocate
 
 
 ___all__ = [
     'download', 'download_sync'
 ]
 
-CHUNK_SIZE = 2048
+# Chunk size grows while the socket has more buffered data than requested
+MIN_CHUNK_SIZE = 2 ** 14
+MAX_CHUNK_SIZE = 2 ** 20
+
+# Smaller segments aren't worth an extra request
+MIN_SEGMENT_SIZE = 2 ** 20
+SEGMENT_RETRIES  = 3
 
 
 def download(urls           : Union[str, Iterable[str], Dict[str, str]],
              path           : str = None,
              session        : aiohttp.ClientSession = None,
              show_progress  : bool = False,
-             max_concurrent : int  = 5,
-             ) -> Awaitable[None]:
+             max_concurrent : Union[int, AdaptiveLimiter] = 5,
+             max_per_host   : int  = None,
+             resume         : bool = False,
+             segments       : int  = None,
+             retry          : Retry = None,
+             breaker        : CircuitBreaker = None,
+             rate_limit     : RateLimiter = None,
+             metrics        : Metrics = None,
+             ) -> Awaitable[Optional['Response[str]']]:
     if isinstance(urls, str):
         return download_one(url=urls,
                             path=path,
                             session=session,
-                            show_progress=show_progress)
+                            show_progress=show_progress,
+                            resume=resume,
+                            segments=segments,
+                            retry=retry,
+                            breaker=breaker,
+                            rate_limit=rate_limit,
+                            metrics=metrics)
     return download_all(**locals())
 
 
 def download_sync(*args    : Any,
                   **kwargs : Any,
-                  ) -> None:
+                  ) -> Optional['Response[str]']:
     return run(download(*args, **kwargs))
 
 
@@ -43,8 +74,67 @@ def download_one(url           : str,
                  path          : str = None,
                  session       : aiohttp.ClientSession = None,
                  show_progress : bool = False,
-                 ) -> Awaitable[None]:
-    return _download_one(**locals())
+                 resume        : bool = False,
+                 segments      : int  = None,
+                 retry         : Retry = None,
+                 breaker       : CircuitBreaker = None,
+                 rate_limit    : RateLimiter = None,
+                 metrics       : Metrics = None,
+                 acquired      : bool = False,
+                 ) -> Awaitable['Response[str]']:
+    """
+    With 'resume=True' the file is written to '<path>.part' and only
+    moved into place once complete, an interrupted download continues
+    from where it stopped, unless the file changed on the server
+
+    With 'segments=N' and a server that accepts ranges, the file is
+    split in N byte ranges fetched concurrently, each written at its
+    offset and retried on its own, 'resume' doesn't apply then
+
+    'retry' reruns the whole download on transient failures,
+    together with 'resume' each attempt continues the previous one
+
+    'acquired=True' tells the first attempt's 'rate_limit' token
+    was already taken, as 'download_all's scheduler does with its slots
+
+    Resolves to a 'Response' with the path written and its 'timings',
+    failures are raised
+    """
+    arguments = locals()
+    del arguments['retry'], arguments['breaker'], arguments['rate_limit'], arguments['acquired']
+
+    timings = Timings()
+    call    : Callable[..., Awaitable[str]]
+    call    = partial(_download_one, **arguments, timings=timings)
+    if rate_limit is not None:
+        call = rate_limit.attempts(url, call, acquired)
+    if breaker is not None:
+        call = partial(breaker.call, url, call)
+    if retry is not None:
+        return _timed(url, retry.call(call), timings, metrics)
+    return _timed(url, call(), timings, metrics)
+
+
+async def _timed(url       : str,
+                 awaitable : Awaitable[str],
+                 timings   : Timings,
+                 metrics   : Metrics = None,
+                 ) -> 'Response[str]':
+    if metrics is not None:
+        metrics.started()
+
+    try:
+        path = await awaitable
+    except Exception as error:
+        if metrics is not None:
+            metrics.finished(timings.finish().elapsed, error)
+        raise
+
+    timings.finish()
+    # Bytes were counted while streaming
+    if metrics is not None:
+        metrics.finished(timings.elapsed)
+    return Response(url, path, timings=timings)
 
 
 async def _download_one(url           : str,
@@ -52,49 +142,221 @@ async def _download_one(url           : str,
                         session       : aiohttp.ClientSession = None,
                         response      : aiohttp.client.ClientResponse = None,
                         show_progress : bool = False,
-                        pbar          : tqdm = None,
-                        ) -> None:
+                        resume        : bool = False,
+                        segments      : int  = None,
+                        metrics       : Metrics = None,
+                        pbar          : MetricsBar = None,
+                        timings       : Timings = None,
+                        ) -> str:
     arguments = locals()
 
     if not session:
-        async with aiohttp.ClientSession() as session:
-            arguments.update(session=session)
-            return await _download_one(**arguments)
+        arguments.update(session=get_session())
+        return await _download_one(**arguments)
+
+    if timings is None:
+        arguments.update(timings=Timings())
+        return await _download_one(**arguments)
+
+    if segments and segments > 1 and not response:
+        path = sensible_download_path(url, path)
+        done = await _download_segmented(url=url,
+                                         path=path,
+                                         session=session,
+                                         segments=segments,
+                                         show_progress=show_progress,
+                                         metrics=metrics,
+                                         timings=timings)
+        if done:
+            return path
+        # Server can't serve ranges, fallback to a single stream
+        arguments.update(path=path, segments=None)
+        return await _download_one(**arguments)
 
     if not response:
-        async with session.get(url) as response:
-            arguments.update(response=response)
+        path = sensible_download_path(url, path)
+        headers = PartFile(path).request_headers() if resume else None
+
+        timings.attempt()
+        async with session.get(url,
+                               headers=headers,
+                               trace_request_ctx=timings,
+                               ) as response:
+            timings.headers_received(response.status)
+            if response.status == 416 or (resume and not PartFile(path).resumes(response)):
+                # The range is wrong for this file, start over
+                PartFile(path).discard()
+                timings.attempt()
+                async with session.get(url, trace_request_ctx=timings) as response:
+                    timings.headers_received(response.status)
+                    check_status(response)
+                    arguments.update(path=path, response=response)
+                    return await _download_one(**arguments)
+
+            check_status(response, 200, 206)
+            arguments.update(path=path, response=response)
             return await _download_one(**arguments)
 
     if show_progress and not pbar:
-        try:
-            total = int(response.headers['Content-Length'])
-        except KeyError:
-            total = None
-
-        with tqdm(**bar_options,
-                  total=total,
-                  unit='b',
-                  ) as pbar:
-            arguments.update(pbar=pbar)
+        async with MetricsBar(Metrics(parent=metrics),
+                              total=content_length(response),
+                              count='bytes',
+                              unit='b',
+                              ) as pbar:
+            arguments.update(metrics=pbar.metrics, pbar=pbar)
             return await _download_one(**arguments)
 
-    path = sensible_download_path(url, path)
-    with open(path, 'wb') as fd:
-        while True:
-            chunk = await response.content.read(CHUNK_SIZE)
-            if not chunk:
-                break
-            if show_progress:
-                pbar.update(len(chunk))
-            fd.write(chunk)
+    path   = sensible_download_path(url, path)
+    size   = content_length(response)
+    target = path
+    offset = 0
+
+    if resume:
+        part   = PartFile(path)
+        target = part.part
+        offset = part.start(response)
+        # Not preallocated, the size of the part is what was written
+        size   = None
+
+    async with FileWriter(target, size=size, offset=offset) as writer:
+        async for chunk in read_chunks(response):
+            if metrics is not None:
+                metrics.add_bytes(len(chunk))
+            await writer.write(chunk)
+
+    timings.body_received(writer.offset - offset)
+
+    if resume:
+        part.finish()
+
+    return path
+
+
+async def _download_segmented(url           : str,
+                              path          : str,
+                              session       : aiohttp.ClientSession,
+                              segments      : int,
+                              show_progress : bool = False,
+                              metrics       : Metrics = None,
+                              timings       : Timings = None,
+                              ) -> bool:
+    timings = timings or Timings()
+    timings.attempt()
+    async with session.head(url,
+                            allow_redirects=True,
+                            trace_request_ctx=timings,
+                            ) as response:
+        timings.headers_received(response.status)
+        size      = content_length(response)
+        ranges    = response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+        validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+
+    if not (response.status == 200 and ranges and size):
+        return False
+
+    segments = min(segments, -(-size // MIN_SEGMENT_SIZE))
+    if segments < 2:
+        return False
+
+    step   = -(-size // segments)
+    bounds = [(start, min(start + step, size) - 1) for start in range(0, size, step)]
+
+    # Size the file once, cutting what an older file had past 'size',
+    # segments fill it in place
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(None, allocate, path, size)
+
+    tasks : List[asyncio.Future] = []
+    try:
+        async with MetricsBar(Metrics(parent=metrics),
+                              total=size,
+                              count='bytes',
+                              unit='b',
+                              disable=not show_progress,
+                              ) as pbar:
+            tasks = [
+                asyncio.ensure_future(_download_segment(
+                    url, path, session, start, end, validator, pbar.metrics,
+                ))
+                for start, end in bounds
+            ]
+            await asyncio.gather(*tasks)
+    except BaseException:
+        # Stop the other segments first, or a retry would create the file again
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        os.remove(path)
+        raise
+
+    timings.body_received(size)
+    return True
+
+
+async def _download_segment(url       : str,
+                            path      : str,
+                            session   : aiohttp.ClientSession,
+                            start     : int,
+                            end       : int,
+                            validator : Optional[str],
+                            metrics   : Metrics,
+                            ) -> None:
+    attempts = 0
+    while True:
+        headers = {'Range': f'bytes={start}-{end}'}
+        if validator:
+            headers['If-Range'] = validator
+
+        writer = FileWriter(path, offset=start, truncate=False)
+        try:
+            async with session.get(url, headers=headers) as response:
+                check_status(response, 206)
+
+                async with writer:
+                    async for chunk in read_chunks(response):
+                        metrics.add_bytes(len(chunk))
+                        await writer.write(chunk)
+            return
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            attempts += 1
+            if attempts > SEGMENT_RETRIES:
+                raise
+            # Continue from the last written byte
+            start = writer.offset
+
+
+def content_length(response: aiohttp.ClientResponse) -> Optional[int]:
+    try:
+        return int(response.headers['Content-Length'])
+    except (KeyError, ValueError):
+        return None
+
+
+async def read_chunks(response : aiohttp.ClientResponse,
+                      ) -> AsyncIterator[bytes]:
+    chunk_size = MIN_CHUNK_SIZE
+    while True:
+        chunk = await response.content.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+        if len(chunk) == chunk_size:
+            chunk_size = min(chunk_size * 2, MAX_CHUNK_SIZE)
 
 
 def download_all(urls           : Union[Iterable[str], Dict[str, str]],
                  path           : str = None,
                  session        : aiohttp.ClientSession = None,
                  show_progress  : bool = False,
-                 max_concurrent : int = 5,
+                 max_concurrent : Union[int, AdaptiveLimiter] = 5,
+                 max_per_host   : int = None,
+                 resume         : bool = False,
+                 segments       : int  = None,
+                 retry          : Retry = None,
+                 breaker        : CircuitBreaker = None,
+                 rate_limit     : RateLimiter = None,
+                 metrics        : Metrics = None,
                  ) -> Awaitable[None]:
     if not isinstance(urls, dict):
         assert not path or os.path.isdir(path), \
@@ -109,8 +371,15 @@ async def _download_all(urls              : Dict[str, str],
                         path              : str = None,
                         session           : aiohttp.ClientSession = None,
                         show_progress     : bool = False,
-                        max_concurrent    : int  = 5,
-                        pbar              : tqdm = None,
+                        max_concurrent    : Union[int, AdaptiveLimiter] = 5,
+                        max_per_host      : int  = None,
+                        resume            : bool = False,
+                        segments          : int  = None,
+                        retry             : Retry = None,
+                        breaker           : CircuitBreaker = None,
+                        rate_limit        : RateLimiter = None,
+                        metrics           : Metrics = None,
+                        pbar              : MetricsBar = None,
                         show_sub_progress : bool = None,
                         ) -> None:
     arguments = locals()
@@ -130,31 +399,39 @@ async def _download_all(urls              : Dict[str, str],
         else:
             show_sub_progress = True if show_progress is None else show_progress
 
-        with tqdm(**bar_options,
-                  total=total,
-                  unit='files',
-                  desc='Overall',
-                  ) as pbar:
-            arguments.update(pbar=pbar,
+        metrics = metrics or Metrics()
+
+        async with MetricsBar(metrics,
+                              total=total,
+                              unit='files',
+                              desc='Overall',
+                              ) as pbar:
+            arguments.update(metrics=metrics,
+                             pbar=pbar,
                              show_sub_progress=show_sub_progress)
             return await _download_all(**arguments)
 
     if not session:
-        async with aiohttp.ClientSession() as session:
-            arguments.update(session=session)
-            return await _download_all(**arguments)
+        arguments.update(session=get_session())
+        return await _download_all(**arguments)
 
-    semaphore = asyncio.Semaphore(max_concurrent)
+    scheduler = HostScheduler(max_concurrent, max_per_host, rate_limit)
 
     async def bound_download_one(url_path : Tuple[str, str]) -> None:
-        async with semaphore:
-            await download_one(url=url_path[0],
-                               path=url_path[1],
-                               session=session,
-                               show_progress=show_sub_progress)
-
-        if show_progress:
-            pbar.update(1)
+        async with scheduler.slot(url_path[0]):
+            await measured(max_concurrent, download_one(
+                url=url_path[0],
+                path=url_path[1],
+                session=session,
+                show_progress=show_sub_progress,
+                resume=resume,
+                segments=segments,
+                retry=retry,
+                breaker=breaker,
+                rate_limit=rate_limit,
+                metrics=metrics,
+                acquired=rate_limit is not None,
+            ))
 
     await asyncio.gather(
         *map(bound_download_one, urls.items()),
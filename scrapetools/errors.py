@@ -0,0 +1,71 @@
+from typing import Any, Mapping, Optional
+
+import time
+from email.utils import parsedate_to_datetime
+
+import aiohttp  # type: ignore
+
+
+__all__ = [
+    'StatusError', 'CircuitOpenError', 'check_status',
+]
+
+
+class StatusError(AssertionError):
+    """
+    Raised on an unexpected HTTP status, subclasses 'AssertionError'
+    since the status used to be asserted directly
+    """
+
+    def __init__(self,
+                 url     : str,
+                 status  : int,
+                 headers : Mapping[str, str] = None,
+                 ) -> None:
+        super().__init__(f'Unexpected response status: {status}')
+        self.url     = url
+        self.status  = status
+        self.headers = dict(headers or {})
+
+    def __reduce__(self) -> Any:
+        return type(self), (self.url, self.status, self.headers)
+
+    @property
+    def retry_after(self) -> Optional[float]:
+        """Seconds to wait according to the 'Retry-After' header, if any"""
+        value = self.headers.get('Retry-After')
+        if value is None:
+            return None
+
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class CircuitOpenError(Exception):
+    """Raised without a request while a host's circuit breaker is open"""
+
+    def __init__(self,
+                 host        : str,
+                 retry_after : float,
+                 ) -> None:
+        super().__init__(f'Circuit open for {host!r}, '
+                         f'retrying in {retry_after:.1f}s')
+        self.host        = host
+        self.retry_after = retry_after
+
+    def __reduce__(self) -> Any:
+        return type(self), (self.host, self.retry_after)
+
+
+def check_status(response : aiohttp.ClientResponse,
+                 *ok      : int,
+                 ) -> None:
+    if response.status not in (ok or (200,)):
+        raise StatusError(str(response.url), response.status, response.headers)
@@ -0,0 +1,148 @@
+from typing import (
+    Any, Callable, Dict, List, Mapping, Optional, Tuple, Union,
+)
+
+from lxml import html  # type: ignore
+
+from .scrape import Document, Matches, _parsed, _query, compile_css
+
+
+__all__ = [
+    'Extractor', 'Field',
+]
+
+
+class Field:
+    """
+    One field of a record: the matches of 'css' and/or 'xpath' within
+    the record, passed through 'convert' one by one, elements as their
+    stripped text, the first one or 'default' unless 'many' is set
+
+    eg:
+
+    Field('span.price', 'text()', convert=float)
+    Field('a', '@href', many=True)
+    """
+
+    def __init__(self,
+                 css     : str  = None,
+                 xpath   : str  = None,
+                 convert : Callable[[Any], Any] = None,
+                 many    : bool = False,
+                 default : Any  = None,
+                 ) -> None:
+        self.css     = css
+        self.xpath   = xpath
+        self.convert = convert
+        self.many    = many
+        self.default = default
+
+        self._compile()
+
+    def _compile(self) -> None:
+        self._query = _query(self.css, self.xpath, smart_strings=False)
+
+    # Compiled queries don't pickle, they are compiled again instead,
+    # so a 'ProcessPoolExecutor' can run extractors too
+    def __getstate__(self) -> Dict[str, Any]:
+        return {key: value for key, value in self.__dict__.items() if key != '_query'}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._compile()
+
+    def __call__(self,
+                 row   : html.HtmlElement,
+                 links : Callable[[str], str] = None,
+                 ) -> Any:
+        matches = self._query(row, links)
+        if not isinstance(matches, list):
+            # xpath functions, eg: 'count(a)', evaluate to a single value
+            return self._convert(matches)
+
+        if self.many:
+            return [self._convert(match) for match in matches]
+        if not matches:
+            return self.default
+        return self._convert(matches[0])
+
+    def _convert(self, match: Any) -> Any:
+        if isinstance(match, html.HtmlElement):
+            match = match.text_content().strip()
+        if self.convert is not None:
+            match = self.convert(match)
+        return match
+
+
+FieldSpec = Union[str, Tuple[Any, ...], Field]
+
+
+class Extractor:
+    """
+    Extracts a record per 'rows' css match (or a single record for the
+    whole document) with a value per field, fields are a css selector,
+    a '(css, xpath, convert)' tuple (the last ones optional) or a 'Field'
+
+    The document is parsed once, each field's query runs relative to
+    its row and only the links it matches are resolved, so a record
+    costs a few lookups instead of a pass over the tree per field
+
+    eg:
+
+    products = Extractor(rows='div.product', fields={
+        'name'  : 'h2',
+        'price' : ('.price', 'text()', float),
+        'url'   : ('a', '@href'),
+        'tags'  : Field('.tag', many=True),
+    })
+
+    products(response)  # [{'name': ..., 'price': 9.99, ...}, ...]
+    await fetch(urls, parse=products)
+    """
+
+    def __init__(self,
+                 fields   : Mapping[str, FieldSpec],
+                 rows     : str = None,
+                 base_url : str = None,
+                 encoding : str = None,
+                 ) -> None:
+        self.rows     = rows
+        self.base_url = base_url
+        self.encoding = encoding
+        self.fields   = {name: _field(spec) for name, spec in fields.items()}
+
+        self._compile()
+
+    def _compile(self) -> None:
+        self._rows : Optional[Callable[[html.HtmlElement], Matches]] = (
+            compile_css(self.rows) if self.rows else None
+        )
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {key: value for key, value in self.__dict__.items() if key != '_rows'}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._compile()
+
+    def __call__(self,
+                 document : Document,
+                 base_url : str = None,
+                 ) -> List[Dict[str, Any]]:
+        root, links = _parsed(document,
+                              base_url=base_url or self.base_url,
+                              encoding=self.encoding)
+
+        rows = self._rows(root) if self._rows is not None else [root]
+        return [
+            {name: field(row, links) for name, field in self.fields.items()}
+            for row in rows
+        ]
+
+
+def _field(spec: FieldSpec) -> Field:
+    if isinstance(spec, Field):
+        return spec
+    if isinstance(spec, str):
+        return Field(spec)
+    return Field(*spec)
@@ -1,16 +1,30 @@
 from typing import (  # NOQA
     Iterator, Any, Generic, TypeVar,
     Callable, Union, Iterable, Awaitable,
-    List,
+    List, AsyncIterator, Deque, Set, Dict, Optional,
 )
 import asyncio
-from functools import wraps
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import wraps, partial
 
 import aiohttp  # type: ignore
-from tqdm import tqdm  # type: ignore
 
+from .adaptive import AdaptiveLimiter, limit_of, measured
+from .breaker import CircuitBreaker
+from .cache import Cache, CacheEntry
+from .errors import check_status
+from .metrics import Metrics, MetricsBar
+from .parse import parsed, parse_response
+from .ratelimit import RateLimiter
 from .response import Response
-from .util import run
+from .retry import Retry
+from .schedule import HostScheduler
+from .sink import Sink
+from .timing import Timings
+from .session import get_session
+from .util import run, run_iter
+from .warc import WarcWriter
 
 
 A = TypeVar('A')
@@ -18,32 +32,48 @@ A = TypeVar('A')
 
 __all__ = [
     'fetch', 'fetch_sync',
+    'fetch_iter', 'fetch_iter_sync',
 ]
 
 
-bar_options = {
-    'bar_format'    : '{l_bar}{bar}|{n_fmt}/{total_fmt}',
-    'dynamic_ncols' : True,
-    'unit_scale'    : True,
-    'leave'         : True,
-}
-
-
 def fetch(urls           : Union[str, Iterable[str]],
           session        : aiohttp.ClientSession = None,
           show_progress  : bool = False,
-          max_concurrent : int  = 1000,
+          max_concurrent : Union[int, AdaptiveLimiter] = 1000,
+          max_per_host   : int  = None,
+          cache          : Cache = None,
+          warc           : WarcWriter = None,
+          parse          : Callable[[str], Any] = None,
+          executor       : Executor = None,
+          raw            : bool = False,
+          retry          : Retry = None,
+          breaker        : CircuitBreaker = None,
+          rate_limit     : RateLimiter = None,
+          metrics        : Metrics = None,
+          sink           : Sink = None,
           ) -> Union[Awaitable['Response'],
-                     Awaitable[List['Response']]]:
+                     Awaitable[List['Response']],
+                     Awaitable[Dict[str, Any]]]:
     if isinstance(urls, str):
-        return fetch_one(url=urls, session=session)
+        return parsed(fetch_one(url=urls,
+                                session=session,
+                                cache=cache,
+                                warc=warc,
+                                raw=raw,
+                                retry=retry,
+                                breaker=breaker,
+                                rate_limit=rate_limit,
+                                metrics=metrics),
+                      parse,
+                      executor)
     return fetch_all(**locals())
 
 
 def fetch_sync(*args    : Any,
                **kwargs : Any,
                ) -> Union['Response',
-                          List['Response']]:
+                          List['Response'],
+                          Dict[str, Any]]:
     return run(fetch(*args, **kwargs))  # type: ignore
 
 
@@ -55,82 +85,407 @@ def responsify(f: Callable[..., Awaitable[A]]
                 **kwargs: Any,
                 ) -> Response[A]:
         try:
-            return Response(url, await f(url, *args, **kwargs))
+            result = await f(url, *args, **kwargs)
         except Exception as error:
             return Response(url, error=error)
 
+        # 'f' may build the response itself to attach extra fields
+        if isinstance(result, Response):
+            return result
+        return Response(url, result)
+
     return _
 
 
+async def fetch_one(url        : str,
+                    session    : aiohttp.ClientSession  = None,
+                    cache      : Cache = None,
+                    warc       : WarcWriter = None,
+                    raw        : bool = False,
+                    retry      : Retry = None,
+                    breaker    : CircuitBreaker = None,
+                    rate_limit : RateLimiter = None,
+                    metrics    : Metrics = None,
+                    acquired   : bool = False,
+                    ) -> 'Response':
+    """
+    'acquired=True' tells the first attempt's 'rate_limit' token
+    was already taken, as 'fetch_all's scheduler does with its slots
+    """
+    if metrics is not None:
+        metrics.started()
+
+    timings  = Timings()
+    response = await _fetch_attempts(url,
+                                     session=session,
+                                     cache=cache,
+                                     warc=warc,
+                                     raw=raw,
+                                     retry=retry,
+                                     breaker=breaker,
+                                     rate_limit=rate_limit,
+                                     acquired=acquired,
+                                     timings=timings)
+    response.timings = timings.finish()
+
+    if metrics is not None:
+        metrics.finished(timings.elapsed, response.error, timings.bytes)
+    return response
+
+
 @responsify
-def fetch_one(url      : str,
-              session  : aiohttp.ClientSession  = None,
-              ) -> Awaitable['Response']:
-    return _fetch_one(url, session)
+def _fetch_attempts(url        : str,
+                    session    : aiohttp.ClientSession  = None,
+                    cache      : Cache = None,
+                    warc       : WarcWriter = None,
+                    raw        : bool = False,
+                    retry      : Retry = None,
+                    breaker    : CircuitBreaker = None,
+                    rate_limit : RateLimiter = None,
+                    acquired   : bool = False,
+                    timings    : Timings = None,
+                    ) -> Awaitable[Union[str, 'Response[bytes]']]:
+    call : Callable[..., Awaitable[Union[str, 'Response[bytes]']]]
+    call = partial(_fetch_one, url, session,
+                   cache=cache,
+                   warc=warc,
+                   raw=raw,
+                   timings=timings)
+
+    # Every attempt takes a token, but not while the circuit is open,
+    # and the breaker goes inside the retries, so an open circuit stops them
+    if rate_limit is not None:
+        call = rate_limit.attempts(url, call, acquired)
+    if breaker is not None:
+        call = partial(breaker.call, url, call)
+    if retry is not None:
+        return retry.call(call)
+    return call()
 
 
 async def _fetch_one(url      : str,
                      session  : aiohttp.ClientSession  = None,
                      response : aiohttp.ClientResponse = None,
-                     ) -> 'Response':
+                     cache    : Cache = None,
+                     entry    : CacheEntry = None,
+                     warc     : WarcWriter = None,
+                     raw      : bool = False,
+                     timings  : Timings = None,
+                     ) -> Union[str, 'Response[bytes]']:
     if not session:
-        async with aiohttp.ClientSession() as session:
-            return await _fetch_one(url,
-                                    session=session,
-                                    response=response,
-                                    )
+        return await _fetch_one(url,
+                                session=get_session(),
+                                response=response,
+                                cache=cache,
+                                warc=warc,
+                                raw=raw,
+                                timings=timings,
+                                )
+
+    timings = timings or Timings()
+
+    if cache is not None and not entry:
+        entry = cache.get(url)
+        if entry and entry.fresh:
+            return _cached(url, entry, raw, timings)
 
     if not response:
-        async with session.get(url) as response:
+        headers = entry.conditional_headers() if entry else None
+        timings.attempt()
+        async with session.get(url,
+                               headers=headers,
+                               trace_request_ctx=timings,
+                               ) as response:
+            timings.headers_received(response.status)
             return await _fetch_one(url,
                                     session=session,
                                     response=response,
+                                    cache=cache,
+                                    entry=entry,
+                                    warc=warc,
+                                    raw=raw,
+                                    timings=timings,
                                     )
 
-    assert response.status == 200, 'Response status is not 200'
+    # Archive every exchange as it happened, errors and 304s included
+    if warc is not None:
+        await warc.archive(response, await response.read())
+
+    if cache is not None and entry and response.status == 304:
+        cache.refresh(url, response.headers)
+        return _cached(url, entry, raw, timings)
+
+    check_status(response)
+
+    body = await response.read()
+    timings.body_received(len(body))
+
+    # Only the declared charset is kept, raw or cached, so lxml still
+    # reads the document's own <meta> when the headers don't say
+    if cache is not None:
+        cache.put(url, body, response.headers, encoding=response.charset)
+
+    # Skip charset detection and decoding, lxml can parse bytes directly
+    if raw:
+        return Response(url, body, encoding=response.charset)
+
+    return body.decode(response.get_encoding())
+
 
-    return await response.text()
+def _cached(url     : str,
+            entry   : CacheEntry,
+            raw     : bool,
+            timings : Timings,
+            ) -> Union[str, 'Response[bytes]']:
+    timings.cached = True
+    timings.body_received(len(entry.body))
+
+    if raw:
+        return Response(url, entry.body, encoding=entry.encoding)
+    return entry.text
 
 
 def fetch_all(urls           : List[str],
               session        : aiohttp.ClientSession = None,
               show_progress  : bool = False,
-              max_concurrent : int  = 1000,
-              ) -> Awaitable[List['Response']]:
+              max_concurrent : Union[int, AdaptiveLimiter] = 1000,
+              max_per_host   : int  = None,
+              cache          : Cache = None,
+              warc           : WarcWriter = None,
+              parse          : Callable[[str], Any] = None,
+              executor       : Executor = None,
+              raw            : bool = False,
+              retry          : Retry = None,
+              breaker        : CircuitBreaker = None,
+              rate_limit     : RateLimiter = None,
+              metrics        : Metrics = None,
+              sink           : Sink = None,
+              ) -> Union[Awaitable[List['Response']],
+                         Awaitable[Dict[str, Any]]]:
+    """
+    With a 'sink', each response is written to it as it completes
+    instead of being collected, and only summary stats are returned
+    (see 'Metrics.snapshot'), urls are pulled lazily as in 'fetch_iter',
+    so batches can be much larger than memory
+    """
     return _fetch_all(**locals())
 
 
 async def _fetch_all(urls           : List[str],
                      session        : aiohttp.ClientSession = None,
                      show_progress  : bool = False,
-                     max_concurrent : int  = 1000,
-                     pbar           : tqdm = None,
+                     max_concurrent : Union[int, AdaptiveLimiter] = 1000,
+                     max_per_host   : int  = None,
+                     cache          : Cache = None,
+                     warc           : WarcWriter = None,
+                     parse          : Callable[[str], Any] = None,
+                     executor       : Executor = None,
+                     raw            : bool = False,
+                     retry          : Retry = None,
+                     breaker        : CircuitBreaker = None,
+                     rate_limit     : RateLimiter = None,
+                     metrics        : Metrics = None,
+                     sink           : Sink = None,
+                     pbar           : MetricsBar = None,
                      ):
     arguments = locals()
 
     if not session:
-        async with aiohttp.ClientSession() as session:
-            arguments.update(session=session)
-            return await _fetch_all(**arguments)
+        arguments.update(session=get_session())
+        return await _fetch_all(**arguments)
+
+    if sink is not None:
+        del arguments['sink'], arguments['pbar']
+        arguments.update(metrics=metrics or Metrics())
+        return await _spill(_fetch_iter(**arguments), sink, arguments['metrics'])
 
     if show_progress and not pbar:
-        urls = list(urls)  # need to unpack for len
+        urls    = list(urls)  # need to unpack for len
+        metrics = metrics or Metrics()
 
-        with tqdm(**bar_options, total=len(urls)) as pbar:
-            arguments.update(urls=urls, pbar=pbar)
+        async with MetricsBar(metrics, total=len(urls)) as pbar:
+            arguments.update(urls=urls, metrics=metrics, pbar=pbar)
             return await _fetch_all(**arguments)
 
-    semaphore = asyncio.Semaphore(max_concurrent)
+    scheduler = HostScheduler(max_concurrent, max_per_host, rate_limit)
 
     async def bound_fetch_one(url : str) -> 'Response':
-        async with semaphore:
-            result = await fetch_one(url=url, session=session)
-
-        if show_progress:
-            pbar.update(1)
+        async with scheduler.slot(url):
+            result = await measured(max_concurrent, fetch_one(
+                url=url,
+                session=session,
+                cache=cache,
+                warc=warc,
+                raw=raw,
+                retry=retry,
+                breaker=breaker,
+                rate_limit=rate_limit,
+                metrics=metrics,
+                acquired=rate_limit is not None,
+            ))
+
+        # Parse outside the slot, so the next request starts meanwhile
+        if parse is not None:
+            result = await parse_response(result, parse, executor)
         return result
 
     return await asyncio.gather(
         *map(bound_fetch_one, urls),
         return_exceptions=True,
     )
+
+
+async def _spill(responses : AsyncIterator['Response'],
+                 sink      : Sink,
+                 metrics   : Metrics,
+                 ) -> Dict[str, Any]:
+    # Writes block on the disk, they go to a thread of their own, in
+    # order, while the next response is awaited
+    loop    = asyncio.get_event_loop()
+    thread  = ThreadPoolExecutor(max_workers=1)
+    writing : Optional[asyncio.Future] = None
+    try:
+        async for response in responses:
+            if writing is not None:
+                await writing
+            writing = loop.run_in_executor(thread, sink.write, response)
+
+        if writing is not None:
+            await writing
+        if hasattr(sink, 'flush'):
+            await loop.run_in_executor(thread, sink.flush)
+    finally:
+        await responses.aclose()  # type: ignore
+        thread.shutdown(wait=True)
+
+    return metrics.snapshot()
+
+
+def fetch_iter(urls           : Iterable[str],
+               session        : aiohttp.ClientSession = None,
+               show_progress  : bool = False,
+               max_concurrent : Union[int, AdaptiveLimiter] = 1000,
+               max_per_host   : int  = None,
+               ordered        : bool = False,
+               cache          : Cache = None,
+               warc           : WarcWriter = None,
+               parse          : Callable[[str], Any] = None,
+               executor       : Executor = None,
+               raw            : bool = False,
+               retry          : Retry = None,
+               breaker        : CircuitBreaker = None,
+               rate_limit     : RateLimiter = None,
+               metrics        : Metrics = None,
+               ) -> AsyncIterator['Response']:
+    """
+    Streaming version of 'fetch_all', pulls urls lazily from any
+    iterable, keeping at most 'max_concurrent' requests in flight,
+    and yields each 'Response' as soon as it is available
+
+    With 'ordered=True' responses are yielded in input order,
+    otherwise in completion order, 'max_per_host' caps the requests
+    in flight to each host within that window
+
+    'parse', if given, runs on each result inside 'executor',
+    see 'parse.parse_response'
+    """
+    return _fetch_iter(**locals())
+
+
+def fetch_iter_sync(*args    : Any,
+                    **kwargs : Any,
+                    ) -> Iterator['Response']:
+    return run_iter(fetch_iter(*args, **kwargs))
+
+
+async def _fetch_iter(urls           : Iterable[str],
+                      session        : aiohttp.ClientSession = None,
+                      show_progress  : bool = False,
+                      max_concurrent : Union[int, AdaptiveLimiter] = 1000,
+                      max_per_host   : int  = None,
+                      ordered        : bool = False,
+                      cache          : Cache = None,
+                      warc           : WarcWriter = None,
+                      parse          : Callable[[str], Any] = None,
+                      executor       : Executor = None,
+                      raw            : bool = False,
+                      retry          : Retry = None,
+                      breaker        : CircuitBreaker = None,
+                      rate_limit     : RateLimiter = None,
+                      metrics        : Metrics = None,
+                      pbar           : MetricsBar = None,
+                      ) -> AsyncIterator['Response']:
+    arguments = locals()
+
+    if not session:
+        arguments.update(session=get_session())
+        async for response in _fetch_iter(**arguments):
+            yield response
+        return
+
+    if show_progress and not pbar:
+        # Don't unpack 'urls', total is only known for sized containers
+        total   = len(urls) if hasattr(urls, '__len__') else None  # type: ignore
+        metrics = metrics or Metrics()
+
+        async with MetricsBar(metrics, total=total) as pbar:
+            arguments.update(metrics=metrics, pbar=pbar)
+            async for response in _fetch_iter(**arguments):
+                yield response
+        return
+
+    urls    = iter(urls)
+    # 'ordered' keeps the in-flight window in input order,
+    # otherwise any finished task can be yielded first
+    pending : Deque[asyncio.Future] = deque()
+    running : Set[asyncio.Future]   = set()
+
+    scheduler = HostScheduler(max_concurrent, max_per_host, rate_limit)
+
+    async def bound_fetch_one(url : str) -> 'Response':
+        async with scheduler.slot(url):
+            return await measured(max_concurrent, fetch_one(url=url,
+                                                            session=session,
+                                                            cache=cache,
+                                                            warc=warc,
+                                                            raw=raw,
+                                                            retry=retry,
+                                                            breaker=breaker,
+                                                            rate_limit=rate_limit,
+                                                            metrics=metrics,
+                                                            acquired=rate_limit is not None))
+
+    def schedule() -> None:
+        window = pending if ordered else running
+        while len(window) < limit_of(max_concurrent):
+            try:
+                url = next(urls)
+            except StopIteration:
+                return
+            task = asyncio.ensure_future(parsed(bound_fetch_one(url), parse, executor))
+            if ordered:
+                pending.append(task)
+            else:
+                running.add(task)
+
+    try:
+        schedule()
+        while pending or running:
+            if ordered:
+                result = await pending.popleft()
+            else:
+                done, _ = await asyncio.wait(running,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                task = done.pop()
+                running.discard(task)
+                result = task.result()
+
+            schedule()
+            yield result
+            # 'urls' may have grown while the consumer held the result,
+            # eg: a crawl frontier, so top up the window before waiting
+            schedule()
+    finally:
+        # Consumer stopped early, don't leave requests behind
+        for task in (*pending, *running):
+            task.cancel()
@@ -1,8 +1,6 @@
-from typing import (
-    Coroutine, Generator, Iterator, Callable,
-    TypeVar, Any,
-)
+from typing import TypeVar, Any
 from asyncio import Task
+from collections.abc import Callable, Coroutine, Generator, Iterator
 
 import asyncio
 from functools import partial, singledispatch
@@ -0,0 +1,334 @@
+from typing import (
+    Any, AsyncIterator, Deque, Dict,
+    List, Optional, Sequence, Tuple,
+)
+import math
+import time
+import asyncio
+from bisect import bisect_left
+from collections import Counter, deque
+
+from tqdm import tqdm  # type: ignore
+
+from .errors import StatusError
+
+
+__all__ = [
+    'Metrics', 'LatencyHistogram', 'MetricsBar', 'error_kind',
+]
+
+
+bar_options = {
+    'bar_format'    : '{l_bar}{bar}|{n_fmt}/{total_fmt}{postfix}',
+    'dynamic_ncols' : True,
+    'unit_scale'    : True,
+    'leave'         : True,
+}
+
+# Prometheus' default buckets, stretched for slow downloads
+PROMETHEUS_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0,
+)
+
+
+class LatencyHistogram:
+    """
+    Streaming latency histogram with logarithmic buckets, each
+    'precision' wider than the previous, so quantiles are off by at
+    most 'precision' (relative) in constant memory and O(1) per sample
+
+    Samples are also counted exactly under each of 'bounds', for export
+    """
+
+    def __init__(self,
+                 precision : float = 0.02,
+                 minimum   : float = 1e-4,
+                 bounds    : Sequence[float] = PROMETHEUS_BUCKETS,
+                 ) -> None:
+        self.minimum = minimum
+        self.bounds  = tuple(bounds)
+        self.count   = 0
+        self.sum     = 0.0
+        self.max     = 0.0
+
+        self._log_factor = math.log1p(precision)
+        self._buckets    : Counter[int] = Counter()
+        self._bounded    = [0] * (len(self.bounds) + 1)
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.sum   += value
+        self.max    = max(self.max, value)
+        self._bounded[bisect_left(self.bounds, value)] += 1
+
+        if value <= self.minimum:
+            self._buckets[0] += 1
+        else:
+            self._buckets[math.ceil(math.log(value / self.minimum) / self._log_factor)] += 1
+
+    def upper(self, index: int) -> float:
+        """Upper bound of bucket 'index'"""
+        return self.minimum * math.exp(index * self._log_factor)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen >= rank:
+                return min(self.upper(index), self.max)
+        return self.max
+
+    def cumulative(self) -> List[int]:
+        """Count of samples under each of 'bounds', as Prometheus buckets"""
+        counts = []
+        total  = 0
+        for count in self._bounded[:-1]:
+            total += count
+            counts.append(total)
+        return counts
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+
+class Metrics:
+    """
+    Cheap counters 'fetch' and 'download' report into
+
+    Tracks completed requests, bytes, requests in flight, errors by
+    kind and a latency histogram, rates are measured over the last
+    'window' seconds between snapshots (since creation on the first one)
+
+    With a 'parent' every count is also reported to it, so a download
+    can have a progress bar of its own and still add to the batch totals
+
+    eg:
+
+    metrics = Metrics()
+    await fetch(urls, metrics=metrics)
+    metrics.snapshot()['latency']['p99']
+    print(metrics.prometheus())
+    """
+
+    def __init__(self,
+                 window : float = 10.0,
+                 parent : 'Metrics' = None,
+                 ) -> None:
+        self.window = window
+        self.parent = parent
+
+        self.requests  = 0
+        self.bytes     = 0
+        self.in_flight = 0
+        self.errors    : Counter[str] = Counter()
+        self.latency   = LatencyHistogram()
+
+        self._started = time.monotonic()
+        self._samples : Deque[Tuple[float, int, int]] = deque(
+            [(self._started, 0, 0)]
+        )
+
+    def started(self) -> None:
+        self.in_flight += 1
+        if self.parent is not None:
+            self.parent.started()
+
+    def finished(self,
+                 latency : float,
+                 error   : BaseException = None,
+                 size    : int = 0,
+                 ) -> None:
+        """
+        Records a finished request, 'size' is for bytes
+        not already reported with 'add_bytes'
+        """
+        self.in_flight -= 1
+        self.requests  += 1
+        self.bytes     += size
+        self.latency.add(latency)
+        if error is not None:
+            self.errors[error_kind(error)] += 1
+
+        if self.parent is not None:
+            self.parent.finished(latency, error, size)
+
+    def add_bytes(self, size: int) -> None:
+        self.bytes += size
+        if self.parent is not None:
+            self.parent.add_bytes(size)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started
+
+    def rates(self) -> Tuple[float, float]:
+        """Requests and bytes per second over the last 'window' seconds"""
+        now = time.monotonic()
+        # Polling often doesn't grow the samples past a hundred per window
+        if now - self._samples[-1][0] >= self.window / 100:
+            self._samples.append((now, self.requests, self.bytes))
+        while len(self._samples) > 2 and now - self._samples[1][0] >= self.window:
+            self._samples.popleft()
+
+        since, requests, size = self._samples[0]
+        elapsed = now - since
+        if elapsed <= 0:
+            return 0.0, 0.0
+        return (self.requests - requests) / elapsed, (self.bytes - size) / elapsed
+
+    def snapshot(self) -> Dict[str, Any]:
+        requests_per_second, bytes_per_second = self.rates()
+        errors = sum(self.errors.values())
+
+        return {
+            'elapsed'             : self.elapsed,
+            'requests'            : self.requests,
+            'bytes'               : self.bytes,
+            'in_flight'           : self.in_flight,
+            'requests_per_second' : requests_per_second,
+            'bytes_per_second'    : bytes_per_second,
+            'errors'              : dict(self.errors),
+            'error_rate'          : errors / self.requests if self.requests else 0.0,
+            'latency'             : {
+                'mean' : self.latency.mean,
+                'p50'  : self.latency.quantile(0.50),
+                'p95'  : self.latency.quantile(0.95),
+                'p99'  : self.latency.quantile(0.99),
+                'max'  : self.latency.max,
+            },
+        }
+
+    async def every(self, interval: float) -> AsyncIterator[Dict[str, Any]]:
+        """Yields a snapshot every 'interval' seconds, forever"""
+        while True:
+            await asyncio.sleep(interval)
+            yield self.snapshot()
+
+    def prometheus(self, prefix: str = 'scrapetools') -> str:
+        """Current values in the Prometheus text exposition format"""
+        lines = [
+            f'# HELP {prefix}_requests_total Finished requests',
+            f'# TYPE {prefix}_requests_total counter',
+            f'{prefix}_requests_total {self.requests}',
+            f'# HELP {prefix}_bytes_total Bytes received',
+            f'# TYPE {prefix}_bytes_total counter',
+            f'{prefix}_bytes_total {self.bytes}',
+            f'# HELP {prefix}_in_flight Requests in flight',
+            f'# TYPE {prefix}_in_flight gauge',
+            f'{prefix}_in_flight {self.in_flight}',
+            f'# HELP {prefix}_errors_total Failed requests by kind',
+            f'# TYPE {prefix}_errors_total counter',
+        ]
+        lines += [
+            f'{prefix}_errors_total{{kind="{kind}"}} {count}'
+            for kind, count in sorted(self.errors.items())
+        ]
+
+        name = f'{prefix}_request_duration_seconds'
+        lines += [
+            f'# HELP {name} Request latency',
+            f'# TYPE {name} histogram',
+        ]
+        lines += [
+            f'{name}_bucket{{le="{bound}"}} {count}'
+            for bound, count in zip(self.latency.bounds, self.latency.cumulative())
+        ]
+        lines += [
+            f'{name}_bucket{{le="+Inf"}} {self.latency.count}',
+            f'{name}_sum {self.latency.sum}',
+            f'{name}_count {self.latency.count}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+def error_kind(error: BaseException) -> str:
+    if isinstance(error, StatusError):
+        return f'status_{error.status}'
+    return type(error).__name__
+
+
+class MetricsBar:
+    """
+    tqdm bar rendered from 'metrics' every 'refresh' seconds,
+    instead of being updated on every request or chunk
+
+    'count' is the counter shown, 'requests' or 'bytes',
+    only what was counted after entering is shown, 'options'
+    go to tqdm, with 'disable=True' nothing is rendered
+
+    eg:
+
+    async with MetricsBar(metrics, total=len(urls)):
+        await fetch(urls, metrics=metrics)
+    """
+
+    def __init__(self,
+                 metrics : Metrics,
+                 total   : int   = None,
+                 count   : str   = 'requests',
+                 refresh : float = 0.5,
+                 **options : Any,
+                 ) -> None:
+        self.metrics = metrics
+        self.total   = total
+        self.count   = count
+        self.refresh = refresh
+        self.options = options
+
+        self._pbar : Optional[tqdm] = None
+        self._task : Optional[asyncio.Future] = None
+        self._base = 0
+
+    async def __aenter__(self) -> 'MetricsBar':
+        self._base = getattr(self.metrics, self.count)
+        self._pbar = tqdm(**{**bar_options, **self.options}, total=self.total)
+        if not self._pbar.disable:
+            self._task = asyncio.ensure_future(self._render_every())
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self.render()
+        if self._pbar is not None:
+            self._pbar.close()
+
+    async def _render_every(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh)
+            self.render()
+
+    def render(self) -> None:
+        pbar = self._pbar
+        if pbar is None:
+            return
+
+        metrics = self.metrics
+        requests_per_second, bytes_per_second = metrics.rates()
+
+        postfix = [
+            f'{requests_per_second:.1f} req/s',
+            f'{_format_bytes(bytes_per_second)}/s',
+            f'{metrics.in_flight} in flight',
+        ]
+        errors = sum(metrics.errors.values())
+        if errors:
+            postfix.append(f'{errors} errors')
+
+        pbar.n = getattr(metrics, self.count) - self._base
+        pbar.set_postfix_str(', '.join(postfix), refresh=False)
+        pbar.refresh()
+
+
+def _format_bytes(size: float) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f'{size:.1f}{unit}'
+        size /= 1024
+    return f'{size:.1f}TB'
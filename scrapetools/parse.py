@@ -0,0 +1,57 @@
+from typing import Any, Awaitable, Callable, TypeVar
+
+import asyncio
+from concurrent.futures import Executor
+
+from .response import Response
+
+
+A = TypeVar('A')
+B = TypeVar('B')
+
+
+__all__ = [
+    'parse_response',
+]
+
+
+async def parse_response(response : 'Response[A]',
+                         parse    : Callable[[A], B],
+                         executor : Executor = None,
+                         ) -> 'Response[B]':
+    """
+    Runs 'parse' on a successful response's result inside 'executor'
+    (the loop's default thread pool if None), keeping the event loop free
+    for network I/O while documents are parsed
+
+    lxml releases the GIL while parsing, so a 'ThreadPoolExecutor'
+    scales across cores for 'scrape'; selector work that holds the GIL
+    can use a 'ProcessPoolExecutor', as long as 'parse' and its
+    result are picklable, eg: 'scrape(css='a', xpath='@href')'
+    """
+    if response.error is not None:
+        return response  # type: ignore
+
+    loop = asyncio.get_event_loop()
+    try:
+        result = await loop.run_in_executor(executor, parse, response.result)
+    except Exception as error:
+        return Response(response.url, error=error, timings=response.timings)
+
+    return Response(response.url, result, timings=response.timings)
+
+
+async def _parse_awaitable(response : Awaitable['Response[A]'],
+                           parse    : Callable[[A], B],
+                           executor : Executor = None,
+                           ) -> 'Response[B]':
+    return await parse_response(await response, parse, executor)
+
+
+def parsed(response : Awaitable['Response[A]'],
+           parse    : Callable[[A], Any] = None,
+           executor : Executor = None,
+           ) -> Awaitable['Response']:
+    if parse is None:
+        return response
+    return _parse_awaitable(response, parse, executor)
@@ -0,0 +1,147 @@
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import time
+import asyncio
+
+from .util import url_host
+
+
+A = TypeVar('A')
+
+
+__all__ = [
+    'TokenBucket', 'RateLimiter',
+]
+
+
+class TokenBucket:
+    """
+    Token bucket refilling 'rate' tokens per second up to 'burst'
+
+    Instead of polling for tokens, each call reserves the next
+    token ahead of time and gets back how long to wait for it
+    """
+
+    def __init__(self,
+                 rate  : float,
+                 burst : float = 1,
+                 ) -> None:
+        self.rate  = rate
+        self.burst = burst
+
+        self._tokens  = float(burst)
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens  = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self) -> float:
+        """How long until a token is ready, without taking it"""
+        self._refill()
+        return max(0, (1 - self._tokens) / self.rate)
+
+    def reserve(self) -> float:
+        self._refill()
+        self._tokens -= 1
+
+        # A negative balance is a debt the caller waits out
+        if self._tokens >= 0:
+            return 0
+        return -self._tokens / self.rate
+
+    async def acquire(self) -> None:
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class RateLimiter:
+    """
+    Requests per second limits, globally and per key
+
+    'rate' limits all requests together, 'per_key' limits each key,
+    the url host by default or what 'key(url)' returns, and 'rates'
+    overrides 'per_key' for specific keys. Every bucket holds up to
+    'burst' tokens, so idle keys can send a short burst at once
+
+    eg:
+
+    limiter = RateLimiter(rate=100, per_key=2, rates={'api.github.com': 10})
+    await fetch(urls, rate_limit=limiter)
+    """
+
+    def __init__(self,
+                 rate    : float = None,
+                 per_key : float = None,
+                 burst   : float = 1,
+                 key     : Callable[[str], str] = url_host,
+                 rates   : Dict[str, float] = None,
+                 ) -> None:
+        self.rate    = rate
+        self.per_key = per_key
+        self.burst   = burst
+        self.key     = key
+        self.rates   = rates or {}
+
+        self._global  = TokenBucket(rate, burst) if rate else None
+        self._buckets : Dict[str, TokenBucket] = {}
+
+    def bucket(self, url: str) -> Optional[TokenBucket]:
+        key = self.key(url)
+        if key not in self._buckets:
+            rate = self.rates.get(key, self.per_key)
+            if not rate:
+                return None
+            self._buckets[key] = TokenBucket(rate, self.burst)
+        return self._buckets[key]
+
+    async def acquire(self, url: str) -> None:
+        # Key first, so the global token isn't held while waiting on the key
+        bucket = self.bucket(url)
+        if bucket is not None:
+            await bucket.acquire()
+        if self._global is not None:
+            await self._global.acquire()
+
+    def delay(self, url: str) -> float:
+        """How long until 'url' has a token ready, without taking it"""
+        buckets = (self.bucket(url), self._global)
+        return max((bucket.delay() for bucket in buckets if bucket is not None), default=0)
+
+    def take(self, url: str) -> None:
+        """Takes the token of 'url', ready or not, as 'HostScheduler' does"""
+        for bucket in (self.bucket(url), self._global):
+            if bucket is not None:
+                bucket.reserve()
+
+    async def call(self,
+                   url      : str,
+                   f        : Callable[..., Awaitable[A]],
+                   *args    : Any,
+                   **kwargs : Any,
+                   ) -> A:
+        await self.acquire(url)
+        return await f(*args, **kwargs)
+
+    def attempts(self,
+                 url      : str,
+                 f        : Callable[..., Awaitable[A]],
+                 acquired : bool = False,
+                 ) -> Callable[..., Awaitable[A]]:
+        """
+        'f' taking a token on every call, as each retry attempt
+        should, except the first one if its token was 'acquired' already
+        """
+        first = acquired
+
+        async def call(*args: Any, **kwargs: Any) -> A:
+            nonlocal first
+            if first:
+                first = False
+            else:
+                await self.acquire(url)
+            return await f(*args, **kwargs)
+
+        return call
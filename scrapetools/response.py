@@ -1,6 +1,7 @@
-from typing import Generic, TypeVar, Iterator, Any, Callable, Union
+from typing import Generic, TypeVar, Iterator, Any, Callable, Optional, Union
 
 from .meta import Show
+from .timing import Timings
 
 
 A = TypeVar('A')
@@ -8,18 +9,25 @@ B = TypeVar('B')
 
 
 class Response(Generic[A], Show):
-    url    : str
-    result : A
-    error  : Exception
+    url      : str
+    result   : A
+    error    : Exception
+    encoding : Optional[str]
+    timings  : Optional[Timings]
 
     def __init__(self,
-                 url    : str,
-                 result : A = None,
-                 error  : Exception = None,
+                 url      : str,
+                 result   : A = None,
+                 error    : Exception = None,
+                 encoding : str = None,
+                 timings  : Timings = None,
                  ) -> None:
-        self.url    = url
-        self.result = result
-        self.error  = error
+        self.url      = url
+        self.result   = result
+        self.error    = error
+        # Declared charset of a raw (bytes) result, if any
+        self.encoding = encoding
+        self.timings  = timings
 
     # __iter__ used mostly for destructuring eg:
     # url, cont, _ = resp
@@ -33,7 +41,7 @@ class Response(Generic[A], Show):
              ) -> 'Union[Response[A], Response[B]]':
         if self.error is not None:
             return self
-        return Response(self.url, f(self.result), self.error)
+        return Response(self.url, f(self.result), self.error, timings=self.timings)
 
     def bind(self,
              f : Callable[[A], 'Response[B]']
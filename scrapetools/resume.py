@@ -0,0 +1,91 @@
+from typing import Dict, Optional
+
+import os
+import re
+import json
+
+import aiohttp  # type: ignore
+
+
+__all__ = [
+    'PartFile',
+]
+
+
+CONTENT_RANGE = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+|\*)')
+
+
+class PartFile:
+    """
+    Bookkeeping for a resumable download of 'path'
+
+    Data goes to '<path>.part', the validators ('ETag'/'Last-Modified')
+    of the response it came from are kept in '<path>.part.json', so a
+    rerun can ask for the missing bytes with 'Range' + 'If-Range' and
+    the server answers with the full file if it has changed since
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.part = path + '.part'
+        self.meta = path + '.part.json'
+
+    @property
+    def validator(self) -> Optional[str]:
+        try:
+            with open(self.meta) as fd:
+                meta = json.load(fd)
+        except (OSError, ValueError):
+            return None
+        return meta.get('etag') or meta.get('last_modified')
+
+    @property
+    def size(self) -> int:
+        try:
+            return os.path.getsize(self.part)
+        except OSError:
+            return 0
+
+    def request_headers(self) -> Dict[str, str]:
+        # Without a validator there is no way to know the bytes
+        # on disk belong to the same version of the file
+        validator = self.validator
+        if not (self.size and validator):
+            return {}
+        return {'Range': f'bytes={self.size}-', 'If-Range': validator}
+
+    def resumes(self, response: aiohttp.ClientResponse) -> bool:
+        """False for a partial response that doesn't continue the part"""
+        if response.status != 206:
+            return True
+        match = CONTENT_RANGE.match(response.headers.get('Content-Range', ''))
+        return match is not None and int(match.group(1)) == self.size
+
+    def start(self, response: aiohttp.ClientResponse) -> int:
+        """
+        Records the response validators and returns the offset its
+        body starts at, 0 when the server sent the whole file
+        """
+        if not self.resumes(response):
+            raise ValueError(f'{response.url} answered with another range than asked for')
+        offset = self.size if response.status == 206 else 0
+
+        with open(self.meta, 'w') as fd:
+            json.dump({
+                'url'           : str(response.url),
+                'etag'          : response.headers.get('ETag'),
+                'last_modified' : response.headers.get('Last-Modified'),
+            }, fd)
+
+        return offset
+
+    def discard(self) -> None:
+        for path in (self.part, self.meta):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def finish(self) -> None:
+        os.replace(self.part, self.path)
+        self.discard()
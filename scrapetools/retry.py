@@ -0,0 +1,90 @@
+from typing import Any, Awaitable, Callable, Iterable, Tuple, Type, TypeVar
+
+import random
+import asyncio
+
+import aiohttp  # type: ignore
+
+from .errors import StatusError
+
+
+A = TypeVar('A')
+
+
+__all__ = [
+    'Retry',
+]
+
+
+RETRY_STATUSES = (408, 425, 429, 500, 502, 503, 504)
+
+RETRY_EXCEPTIONS : Tuple[Type[BaseException], ...] = (
+    aiohttp.ClientConnectionError,
+    aiohttp.ClientPayloadError,
+    asyncio.TimeoutError,
+)
+
+
+class Retry:
+    """
+    Retry policy for transient failures
+
+    Retries up to 'attempts' times in total on connection errors,
+    timeouts and the 'statuses' given, waiting an exponential backoff
+    with full jitter between attempts, or what the server asks for
+    in 'Retry-After' (at most 'max_retry_after' seconds)
+
+    eg:
+
+    await fetch(urls, retry=Retry(attempts=5, backoff=1))
+    """
+
+    def __init__(self,
+                 attempts        : int   = 3,
+                 backoff         : float = 0.5,
+                 max_backoff     : float = 30,
+                 jitter          : bool  = True,
+                 statuses        : Iterable[int] = RETRY_STATUSES,
+                 exceptions      : Tuple[Type[BaseException], ...] = RETRY_EXCEPTIONS,
+                 max_retry_after : float = 120,
+                 ) -> None:
+        self.attempts        = attempts
+        self.backoff         = backoff
+        self.max_backoff     = max_backoff
+        self.jitter          = jitter
+        self.statuses        = frozenset(statuses)
+        self.exceptions      = exceptions
+        self.max_retry_after = max_retry_after
+
+    def retryable(self, error: BaseException) -> bool:
+        if isinstance(error, StatusError):
+            return error.status in self.statuses
+        return isinstance(error, self.exceptions)
+
+    def delay(self,
+              attempt : int,
+              error   : BaseException,
+              ) -> float:
+        """Seconds to wait after the failed 'attempt' (starting from 1)"""
+        if isinstance(error, StatusError) and error.retry_after is not None:
+            return min(error.retry_after, self.max_retry_after)
+
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        if self.jitter:
+            return random.uniform(0, delay)
+        return delay
+
+    async def call(self,
+                   f       : Callable[..., Awaitable[A]],
+                   *args   : Any,
+                   **kwargs: Any,
+                   ) -> A:
+        attempt = 1
+        while True:
+            try:
+                return await f(*args, **kwargs)
+            except Exception as error:
+                if attempt >= self.attempts or not self.retryable(error):
+                    raise
+                await asyncio.sleep(self.delay(attempt, error))
+                attempt += 1
@@ -0,0 +1,199 @@
+from typing import Any, Deque, Dict, Optional, Tuple, Union
+
+import asyncio
+from collections import deque, Counter
+
+from .adaptive import AdaptiveLimiter, limit_of
+from .ratelimit import RateLimiter
+from .util import url_host
+
+
+__all__ = [
+    'HostScheduler',
+]
+
+
+# A host, and the rate limit key of its urls
+Queue = Tuple[str, Optional[str]]
+
+
+class HostScheduler:
+    """
+    Concurrency limiter with a global limit and a per host limit
+
+    Waiting requests are granted slots round-robin between hosts,
+    so a heavily represented or slow host can't take every slot
+    while the others sit idle
+
+    eg:
+
+    scheduler = HostScheduler(max_concurrent=100, max_per_host=4)
+
+    async with scheduler.slot(url):
+        ...
+
+    'max_concurrent' can be an 'AdaptiveLimiter', then the global
+    limit follows its current window
+
+    With a 'rate_limit' a slot is only granted once the request's token
+    is ready, and the token is taken then, as the request goes out, so
+    requests held back by their rate neither keep slots nor pile up
+    behind a busy one and go out all at once
+    """
+
+    def __init__(self,
+                 max_concurrent : Union[int, AdaptiveLimiter] = 1000,
+                 max_per_host   : int = None,
+                 rate_limit     : RateLimiter = None,
+                 ) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_per_host   = max_per_host
+        self.rate_limit     = rate_limit
+
+        self._active      = 0
+        self._host_active : Counter = Counter()
+        # Waiters queue by host, and by rate limit key when there is one,
+        # so a throttled key doesn't hold back the rest of its host
+        self._waiters     : Dict[Queue, Deque[Tuple[Optional[str], asyncio.Future]]] = {}
+        # Queues with waiters, in round-robin order
+        self._queues      : Deque[Queue] = deque()
+        # Wakes '_dispatch' up once the next token is ready
+        self._timer       : Optional[asyncio.TimerHandle] = None
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def slot(self, url: str) -> '_Slot':
+        return _Slot(self, url_host(url), url)
+
+    async def acquire(self,
+                      host : str,
+                      url  : str = None,
+                      ) -> None:
+        """Waits for a slot for 'host', and for the token of 'url' if given"""
+        waiter = asyncio.get_event_loop().create_future()
+        queue  = (host, self._key(url))
+
+        if queue not in self._waiters:
+            self._waiters[queue] = deque()
+            self._queues.append(queue)
+        self._waiters[queue].append((url, waiter))
+
+        self._dispatch()
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Slot was granted right before the cancellation
+                self.release(host)
+            else:
+                self._forget(queue, waiter)
+            raise
+
+    def release(self, host: str) -> None:
+        self._active -= 1
+        self._host_active[host] -= 1
+        if not self._host_active[host]:
+            del self._host_active[host]
+
+        self._dispatch()
+
+    def _key(self, url: Optional[str]) -> Optional[str]:
+        if self.rate_limit is None or url is None:
+            return None
+        return self.rate_limit.key(url)
+
+    def _host_full(self, host: str) -> bool:
+        if self.max_per_host is None:
+            return False
+        return self._host_active[host] >= self.max_per_host
+
+    def _dispatch(self) -> None:
+        skipped = 0
+        wait    : Optional[float] = None
+        while self._queues and self._active < limit_of(self.max_concurrent):
+            if skipped >= len(self._queues):
+                # Every waiting host is at its own limit or out of tokens
+                break
+
+            queue = self._queues[0]
+            self._queues.rotate(-1)
+
+            host, _ = queue
+            if self._host_full(host):
+                skipped += 1
+                continue
+
+            waiters     = self._waiters[queue]
+            url, waiter = waiters[0]
+            if self.rate_limit is not None and url is not None and not waiter.done():
+                delay = self.rate_limit.delay(url)
+                if delay > 0:
+                    wait = delay if wait is None else min(wait, delay)
+                    skipped += 1
+                    continue
+
+            waiters.popleft()
+            if not waiters:
+                # 'queue' was rotated to the end
+                self._queues.pop()
+                del self._waiters[queue]
+
+            if waiter.done():
+                continue
+
+            if self.rate_limit is not None and url is not None:
+                # Taken as the request goes out, not while it waits
+                self.rate_limit.take(url)
+            self._active += 1
+            self._host_active[host] += 1
+            waiter.set_result(None)
+            skipped = 0
+
+        if wait is not None:
+            self._wake_in(wait)
+
+    def _wake_in(self, delay: float) -> None:
+        loop = asyncio.get_event_loop()
+        when = loop.time() + delay
+        if self._timer is not None:
+            if self._timer.when() <= when:
+                return
+            self._timer.cancel()
+        self._timer = loop.call_at(when, self._wake)
+
+    def _wake(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+    def _forget(self, queue: Queue, waiter: asyncio.Future) -> None:
+        waiters = self._waiters.get(queue)
+        if waiters is None:
+            return
+
+        for entry in waiters:
+            if entry[1] is waiter:
+                waiters.remove(entry)
+                break
+        if not waiters:
+            del self._waiters[queue]
+            self._queues.remove(queue)
+
+
+class _Slot:
+    def __init__(self,
+                 scheduler : HostScheduler,
+                 host      : str,
+                 url       : str = None,
+                 ) -> None:
+        self.scheduler = scheduler
+        self.host      = host
+        self.url       = url
+
+    async def __aenter__(self) -> None:
+        await self.scheduler.acquire(self.host, self.url)
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        self.scheduler.release(self.host)
@@ -1,8 +1,29 @@
-from typing import Union, List
+from typing import (
+    Union, List, Tuple, Optional, Any, Awaitable, Dict,
+    Callable, Deque, Iterable, Iterator, Mapping, cast,
+)
 
-from functools import partial
+import os
+import re
+import codecs
+import asyncio
+from collections import deque
+from weakref import WeakSet
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from copy import deepcopy
+from functools import partial, lru_cache
+from urllib.parse import urljoin
 from urllib.request import urlopen
-from lxml import html  # type: ignore
+from lxml import html, etree  # type: ignore
+from lxml.html import defs  # type: ignore
+from lxml.cssselect import CSSSelector  # type: ignore
+import aiohttp  # type: ignore
+
+from .errors import check_status
+from .fetch import _fetch_one
+from .response import Response
+from .session import get_session
+from .util import run
 
 
 Url = str
@@ -14,11 +35,12 @@ Matches = Union[List[html.HtmlElement],
                 ]
 
 
-def scrape(data     : Union[Url, Html, html.HtmlElement] = None,
+def scrape(data     : Union[Url, Html, bytes, html.HtmlElement] = None,
            css      : str = None,
            xpath    : str = None,
            base_url : str = None,
            flatten  : bool = True,
+           encoding : str = None,
            ) -> Union[Matches, partial]:
     if data is None:
         return partial(scrape,
@@ -26,44 +48,564 @@ def scrape(data     : Union[Url, Html, html.HtmlElement] = None,
                        xpath=xpath,
                        base_url=base_url,
                        flatten=flatten,
+                       encoding=encoding,
                        )
 
+    if isinstance(data, str) and data.startswith('http'):
+        base_url = base_url or data
+
+        # 'data' WILL contain the raw html bytes after this clause
+        data, encoding = _fetch_page(data)
+
     # 'data' WILL contain a lxml.html.HtmlElement after this clause
-    if isinstance(data, str):
-        # 'data' WILL contain a html string after this clause
-        if data.startswith('http'):
-            base_url = base_url or data
+    data, links = _parsed(data, base_url, encoding)
 
-            with urlopen(data) as response:
-                data = response.read()
+    return _select(data, css, xpath, flatten, links=links)
+
+
+def _select(data    : html.HtmlElement,
+            css     : str  = None,
+            xpath   : str  = None,
+            flatten : bool = True,
+            limit   : int  = None,
+            links   : Callable[[str], str] = None,
+            ) -> Matches:
+    return _query(css, xpath, flatten, limit)(data, links)
+
+
+Query    = Callable[..., Matches]
+Document = Union[Html, bytes, html.HtmlElement, Response]
 
-        if base_url:
-            data = html.fromstring(data, base_url=base_url)
-        else:
-            data = html.fromstring(data)
 
-    # If possible, resolve relative links
-    if base_url:
-        data = html.make_links_absolute(
-            data,
-            base_url=base_url,
-        )
+def _query(css           : str  = None,
+           xpath         : str  = None,
+           flatten       : bool = True,
+           limit         : int  = None,
+           smart_strings : bool = True,
+           ) -> Query:
+    """
+    The compiled query for 'css' and/or 'xpath', to run on many
+    documents as 'query(root, links)', 'links' resolves the links of
+    the matches only, see '_resolved', unless the selectors filter on
+    link values, eg: 'a[href^="http"]', then the whole tree is
+    resolved once first, like '_evaluated' does
+    """
+    query = _lazy_query(css, xpath, flatten, limit, smart_strings)
 
+    paths = [compile_css(css).path] if css else []
+    if not _filters_links(*paths, *([xpath] if xpath else [])):
+        return query
+
+    def resolved_first(data  : html.HtmlElement,
+                       links : Callable[[str], str] = None,
+                       ) -> Matches:
+        if links is not None:
+            _resolve_tree(data, links)
+        return query(data, links)
+
+    return resolved_first
+
+
+def _lazy_query(css           : str  = None,
+                xpath         : str  = None,
+                flatten       : bool = True,
+                limit         : int  = None,
+                smart_strings : bool = True,
+                ) -> Query:
     if not (css or xpath):
-        return [data]
+        return lambda data, links=None: _resolved([data], links, smart_strings)
+
+    if not xpath:
+        elements = compile_css(css)
+        return lambda data, links=None: _resolved(elements(data)[:limit], links, smart_strings)
+
+    select = compile_css(css) if css else None
+    # Resolving needs the smart strings, to know where a match comes from
+    smart  = compile_xpath(xpath)
+    plain  = compile_xpath(xpath, smart_strings)
+
+    def query(data  : html.HtmlElement,
+              links : Callable[[str], str] = None,
+              ) -> Matches:
+        evaluate = smart if links is not None else plain
+
+        if select is None:
+            result = _evaluated(evaluate, data, links)
+            if isinstance(result, list):
+                result = result[:limit]
+            return _resolved(result, links, smart_strings)
 
-    if css and xpath:
         result = [
-            el.xpath(xpath)
-            for el in data.cssselect(css)
+            _resolved(_evaluated(evaluate, el, links), links, smart_strings)
+            for el in select(data)[:limit]
         ]
-
         if flatten:
             result = [el for row in result for el in row]
         return result
-    elif css:
-        return data.cssselect(css)
+
+    return query
+
+
+# Resolvers whose whole tree was resolved already
+_resolved_trees : 'WeakSet[Callable[[str], str]]' = WeakSet()
+
+
+def _evaluated(evaluate : Callable[[html.HtmlElement], Any],
+               data     : html.HtmlElement,
+               links    : Optional[Callable[[str], str]],
+               ) -> Any:
+    """
+    'evaluate(data)', xpath functions, eg: 'string(@href)', don't tell
+    which nodes they read, so their tree is resolved whole, once,
+    and they are evaluated again
+    """
+    result = evaluate(data)
+    if isinstance(result, list) or links is None:
+        return result
+
+    _resolve_tree(data, links)
+    return evaluate(data)
+
+
+def _resolve_tree(data  : html.HtmlElement,
+                  links : Callable[[str], str],
+                  ) -> None:
+    if links not in _resolved_trees:
+        data.getroottree().getroot().rewrite_links(links, resolve_base_href=False)
+        _resolved_trees.add(links)
+
+
+# Attributes 'rewrite_links' may change
+LINK_ATTRIBUTES = defs.link_attrs | {'style', 'content', 'value'}
+
+
+_xpath_tokens = re.compile(r'''"[^"]*"|'[^']*'|(?:@|attribute::)\s*([\w.:*-]+)|[\w.-]+|\S''')
+
+
+def _filters_links(*paths: str) -> bool:
+    """
+    If any of the xpath 'paths' reads a link attribute's value inside a
+    predicate or function, eg: 'a[starts-with(@href, "http")]', so
+    what matches depends on the resolved links, only testing that the
+    attribute is there, eg: 'a[@href]', doesn't count
+    """
+    for path in paths:
+        tokens = [(match.group(0), match.group(1))
+                  for match in _xpath_tokens.finditer(path)]
+        depth  = 0
+
+        for i, (token, attribute) in enumerate(tokens):
+            if token in ('[', '('):
+                depth += 1
+            elif token in (']', ')'):
+                depth -= 1
+            elif depth and attribute and _is_link_attribute(attribute):
+                before  = tokens[i - 1][0] if i else None
+                after   = tokens[i + 1][0] if i + 1 < len(tokens) else None
+                negated = before == '(' and i > 1 and tokens[i - 2][0] == 'not'
+                tested  = before in ('[', 'and', 'or') or negated
+                if not (tested and after in (']', ')', 'and', 'or')):
+                    return True
+    return False
+
+
+def _is_link_attribute(name: str) -> bool:
+    return name == '*' or name.split(':')[-1].lower() in LINK_ATTRIBUTES
+
+
+def _resolved(matches       : Any,
+              links         : Optional[Callable[[str], str]],
+              smart_strings : bool = True,
+              ) -> Any:
+    """
+    Resolves the links in 'matches' alone, instead of the whole tree,
+    with the same results: matched elements are rewritten in place, and
+    link attributes are read again once their element is rewritten
+    """
+    if not isinstance(matches, list):
+        return matches
+
+    if links is not None:
+        matches = [_resolve(match, links, smart_strings) for match in matches]
+    if not smart_strings:
+        matches = [str(match) if isinstance(match, str) else match for match in matches]
+    return matches
+
+
+def _resolve(match         : Any,
+             links         : Callable[[str], str],
+             smart_strings : bool = True,
+             ) -> Any:
+    if isinstance(match, html.HtmlElement):
+        match.rewrite_links(links, resolve_base_href=False)
+        return match
+
+    if getattr(match, 'is_attribute', False) and match.attrname in LINK_ATTRIBUTES:
+        name, owner = match.attrname, match.getparent()
+
+        if name in defs.link_attrs and owner.tag != 'object':
+            # The common case, the whole value is the link
+            link = links(match.strip())
+            if link == match:
+                return match
+            owner.set(name, link)
+        else:
+            owner.rewrite_links(links, resolve_base_href=False)
+
+        # Read again as a smart string, like the original match
+        return _attribute(owner, name=name)[0] if smart_strings else owner.get(name)
+
+    if getattr(match, 'is_text', False):
+        owner = match.getparent()
+        if isinstance(owner, html.HtmlElement) and owner.tag == 'style':
+            # Urls in stylesheets are links too
+            owner.rewrite_links(links, resolve_base_href=False)
+            return _text(owner)[0]
+
+    return match
+
+
+_attribute = etree.XPath('@*[name() = $name]')
+_text      = etree.XPath('text()')
+
+
+def _parsed(document : 'Document',
+            base_url : str = None,
+            encoding : str = None,
+            ) -> Tuple[html.HtmlElement, Optional[Callable[[str], str]]]:
+    """
+    Parsed tree of 'document', and the function resolving its links
+    against 'base_url' (or the response's url), if any, for '_resolved'
+    """
+    if isinstance(document, Response):
+        if document.error is not None:
+            raise document.error
+        base_url = document.url
+        encoding = document.encoding or encoding
+        document = document.result
+
+    if isinstance(document, (str, bytes)):
+        document = parse_html(document, base_url=base_url, encoding=encoding)
+    elif base_url:
+        # Matches are resolved in place, the caller's tree is left alone
+        document = deepcopy(document)
+
+    if not base_url:
+        return document, None
+    return document, _link_resolver(document, base_url)
+
+
+def _link_resolver(root     : html.HtmlElement,
+                   base_url : str,
+                   ) -> Callable[[str], str]:
+    """
+    What 'make_links_absolute(base_url)' does to each link, including
+    a <base href> in the document (the last one wins), which is
+    removed from the tree the same way
+    """
+    base_href = None
+    for base in _base_tags(root):
+        base_href = base.get('href')
+        base.drop_tree()
+
+    if not base_href:
+        return partial(urljoin, base_url)
+
+    def resolve(link: str) -> str:
+        return urljoin(base_url, urljoin(base_href, link).strip())
+    return resolve
+
+
+_base_tags = etree.XPath('//base[@href]')
+
+
+Selector = Union[str, Tuple[Optional[str], Optional[str]]]
+
+
+def scrape_all(documents : Iterable[Document],
+               selectors : Mapping[str, Selector],
+               base_url  : str  = None,
+               flatten   : bool = True,
+               encoding  : str  = None,
+               executor  : Executor = None,
+               workers   : int  = None,
+               ) -> Dict[str, List[Any]]:
+    """
+    Runs every selector on every document, returning a column per
+    selector, a list with each document's matches in input order
+
+    'selectors' maps names to a css selector or a '(css, xpath)' pair,
+    compiled once for the whole batch, documents are html strings,
+    bytes or 'Response's (their url as 'base_url'), never urls,
+    and are parsed in parallel in 'executor', by default a thread
+    pool of 'workers' threads, lxml releases the GIL while parsing
+
+    A failed 'Response' or a document that fails to parse gets its
+    exception object in every column, like 'fmap' does
+
+    Text matches are plain strings, so they don't keep their whole
+    document alive, unlike the ones 'scrape' returns
+
+    eg:
+
+    columns = scrape_all(responses, {
+        'title' : ('title', 'text()'),
+        'links' : ('a', '@href'),
+    })
+    columns['title']  # [['Python'], ['Docs'], ...]
+    """
+    rows    = list(scrape_iter(**locals()))
+    columns : Dict[str, List[Any]] = {name: [] for name in selectors}
+
+    for row in rows:
+        for name, column in columns.items():
+            column.append(row.error if row.error is not None else row.result[name])
+    return columns
+
+
+def scrape_iter(documents : Iterable[Document],
+                selectors : Mapping[str, Selector],
+                base_url  : str  = None,
+                flatten   : bool = True,
+                encoding  : str  = None,
+                executor  : Executor = None,
+                workers   : int  = None,
+                ) -> Iterator[Response]:
+    """
+    Streaming version of 'scrape_all', pulls documents lazily and
+    yields a 'Response' per document in input order, its result a
+    dict of selector name to matches, with a bounded read-ahead
+
+    eg:
+
+    for url, row, error in scrape_iter(fetch_iter_sync(urls), {'title': 'title'}):
+        ...
+    """
+    queries = {
+        name: _query(*((selector, None) if isinstance(selector, str) else selector),
+                     flatten=flatten,
+                     smart_strings=False)
+        for name, selector in selectors.items()
+    }
+
+    def scrape_one(document: Document) -> Response:
+        return _scrape_document(document, queries, base_url, encoding)
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(workers or os.cpu_count())
+
+    # Enough documents ahead to keep every worker busy
+    window  = 4 * (workers or os.cpu_count() or 1)
+    pending : Deque[Future] = deque()
+    try:
+        for document in documents:
+            pending.append(executor.submit(scrape_one, document))  # type: ignore
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=False)  # type: ignore
+
+
+def _scrape_document(document : Document,
+                     queries  : Mapping[str, Query],
+                     base_url : Optional[str],
+                     encoding : Optional[str],
+                     ) -> Response:
+    if isinstance(document, Response) and document.error is not None:
+        return document
+
+    # Documents without a url nor a 'base_url' are left with None
+    url = cast(str, document.url if isinstance(document, Response) else base_url)
+    try:
+        root, links = _parsed(document, base_url, encoding)
+        row = {name: query(root, links) for name, query in queries.items()}
+    except Exception as error:
+        return Response(url, error=error)
+
+    return Response(url, row)
+
+
+def document_root(document : Document,
+                  base_url : str = None,
+                  encoding : str = None,
+                  ) -> html.HtmlElement:
+    """
+    Parsed tree of a html string, bytes or successful 'Response'
+    (raising its error otherwise), with every link resolved against
+    'base_url' or the response's url, for when the whole tree is needed,
+    'scrape' and the like only resolve the links they match
+    """
+    root, links = _parsed(document, base_url, encoding)
+    if links is not None:
+        root.rewrite_links(links, resolve_base_href=False)
+    return root
+
+
+def scrape_stream(url        : Url,
+                  css        : str  = None,
+                  xpath      : str  = None,
+                  limit      : int  = None,
+                  base_url   : str  = None,
+                  flatten    : bool = True,
+                  session    : aiohttp.ClientSession = None,
+                  chunk_size : int  = 2 ** 16,
+                  ) -> Awaitable[Matches]:
+    """
+    Like 'scrape' for an url, but feeds the document into lxml chunk
+    by chunk as it downloads, and cancels the download as soon as the
+    first 'limit' matches are complete (eg: something in the <head>)
+
+    'limit' counts the css matches when both 'css' and 'xpath' are given
+
+    Matches are evaluated against the partial document, so selectors
+    that depend on what comes after an element (eg: ':last-child')
+    may match early
+    """
+    return _scrape_stream(**locals())
+
+
+def scrape_stream_sync(*args    : Any,
+                       **kwargs : Any,
+                       ) -> Matches:
+    return run(scrape_stream(*args, **kwargs))
+
+
+async def _scrape_stream(url        : Url,
+                         css        : str  = None,
+                         xpath      : str  = None,
+                         limit      : int  = None,
+                         base_url   : str  = None,
+                         flatten    : bool = True,
+                         session    : aiohttp.ClientSession = None,
+                         chunk_size : int  = 2 ** 16,
+                         ) -> Matches:
+    session  = session or get_session()
+    base_url = base_url or url
+
+    async with session.get(url) as response:
+        check_status(response)
+
+        parser = etree.HTMLPullParser(events=('start', 'end'),
+                                      base_url=base_url,
+                                      **_encoding_option(response.charset))
+        parser.set_element_class_lookup(html.HtmlElementClassLookup())
+
+        # Elements started but not ended yet, their content may be partial
+        open_elements : List[etree._Element] = []
+        root = None
+
+        async for chunk in response.content.iter_chunked(chunk_size):
+            parser.feed(chunk)
+            for event, el in parser.read_events():
+                if event == 'start':
+                    open_elements.append(el)
+                    if root is None:
+                        root = el
+                else:
+                    while open_elements and open_elements.pop() is not el:
+                        pass
+
+            if limit is not None and root is not None:
+                if _first_complete(root, css, xpath, limit, open_elements):
+                    # Leaving the context early drops the connection
+                    break
+
+    root = parser.close()
+    return _select(root, css, xpath, flatten, limit, _link_resolver(root, base_url))
+
+
+def _first_complete(root          : html.HtmlElement,
+                    css           : Optional[str],
+                    xpath         : Optional[str],
+                    limit         : int,
+                    open_elements : List[etree._Element],
+                    ) -> bool:
+    """True when the first 'limit' matches can't change anymore"""
+    if css:
+        matches = compile_css(css)(root)
     elif xpath:
-        return data.xpath(xpath)
+        matches = compile_xpath(xpath)(root)
+        if not isinstance(matches, list):
+            return False
+    else:
+        return False
+
+    if len(matches) < limit:
+        return False
+
+    for match in matches[:limit]:
+        if isinstance(match, etree._Element):
+            el = match
+        elif getattr(match, 'is_attribute', False):
+            # Attributes are complete once the start tag is parsed
+            continue
+        elif getattr(match, 'is_tail', False):
+            # A tail can grow until its parent is closed
+            el = match.getparent().getparent()
+        else:
+            el = getattr(match, 'getparent', lambda: None)()
+
+        if el is None or any(el is open_el for open_el in open_elements):
+            return False
+    return True
+
+
+def _encoding_option(encoding: Optional[str]) -> Dict[str, str]:
+    if encoding and _html_parser(encoding) is not None:
+        return {'encoding': codecs.lookup(encoding).name}
+    return {}
+
+
+def parse_html(data     : Union[Html, bytes],
+               base_url : str = None,
+               encoding : str = None,
+               ) -> html.HtmlElement:
+    """
+    Parses a html string or raw bytes, for bytes 'encoding' is used as
+    a hint, otherwise lxml detects it from the document itself
+    """
+    parser = None
+    if encoding and isinstance(data, bytes):
+        parser = _html_parser(encoding)
+
+    return html.fromstring(data, base_url=base_url, parser=parser)
+
+
+def _html_parser(encoding: str) -> Optional[html.HTMLParser]:
+    # libxml2 doesn't know every python alias, eg: 'latin-1'
+    try:
+        return html.HTMLParser(encoding=codecs.lookup(encoding).name)
+    except LookupError:
+        return None
+
+
+# Selectors are usually reused across many documents,
+# so translating and compiling them once is worth caching
+@lru_cache(maxsize=256)
+def compile_css(css: str) -> CSSSelector:
+    return CSSSelector(css, translator='html')
+
+
+@lru_cache(maxsize=256)
+def compile_xpath(xpath         : str,
+                  smart_strings : bool = True,
+                  ) -> etree.XPath:
+    return etree.XPath(xpath, smart_strings=smart_strings)
+
+
+def _fetch_page(url: str) -> Tuple[bytes, Optional[str]]:
+    # Blocking on the shared pool from inside a running loop
+    # would deadlock, fallback to a plain blocking request there
+    if asyncio.get_event_loop().is_running():
+        with urlopen(url) as response:
+            return response.read(), response.headers.get_content_charset()
 
-    raise TypeError("Invalid arguments")
+    # 'raw=True' always gives a 'Response'
+    page : Response[bytes] = cast(Response, run(_fetch_one(url, raw=True)))
+    return page.result, page.encoding
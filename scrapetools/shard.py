@@ -0,0 +1,269 @@
+from typing import (
+    Any, Awaitable, Callable, Deque, Dict,
+    Iterable, Iterator, List, Optional, Set,
+)
+import os
+import zlib
+import pickle
+import asyncio
+import threading
+import multiprocessing
+from collections import deque
+from queue import Empty, Full
+
+from .breaker import CircuitBreaker
+from .fetch import fetch_one
+from .parse import parsed
+from .ratelimit import RateLimiter
+from .response import Response
+from .retry import Retry
+from .schedule import HostScheduler
+from .session import SessionPool
+from .util import url_host
+
+
+__all__ = [
+    'fetch_sharded', 'shard_of',
+]
+
+
+def fetch_sharded(urls           : Iterable[str],
+                  workers        : int = None,
+                  max_concurrent : int = 1000,
+                  max_per_host   : int = None,
+                  raw            : bool = False,
+                  parse          : Callable[[Any], Any] = None,
+                  retry          : Retry = None,
+                  breaker        : CircuitBreaker = None,
+                  rate_limit     : RateLimiter = None,
+                  batch_size     : int = 100,
+                  queue_size     : int = 64,
+                  ) -> Iterator[Response]:
+    """
+    Fetches 'urls' across 'workers' processes (one per core by default),
+    each with its own event loop and session, yielding every 'Response'
+    in completion order as they come back
+
+    Urls are pulled lazily and sharded by host, so connections are
+    reused, and 'max_per_host', 'breaker' and per host rate limits hold
+    exactly, while 'max_concurrent' and global rates apply per worker
+
+    Urls and responses travel in batches of up to 'batch_size' through
+    queues of 'queue_size' batches, a slow consumer holds the workers back
+
+    'parse' runs in the workers, it must be picklable, as the options
+    and its results, eg: 'scrape(css='a', xpath='@href')' but not
+    'scrape(css='a')', lxml elements don't pickle, such responses
+    come back with a 'TypeError'
+
+    eg:
+
+    for url, links, error in fetch_sharded(urls, parse=scrape(css='a', xpath='@href')):
+        ...
+    """
+    workers = workers or os.cpu_count() or 1
+    options = {
+        'max_concurrent' : max_concurrent,
+        'max_per_host'   : max_per_host,
+        'raw'            : raw,
+        'parse'          : parse,
+        'retry'          : retry,
+        'breaker'        : breaker,
+        'rate_limit'     : rate_limit,
+    }
+
+    context   = multiprocessing.get_context()
+    inputs    = [context.Queue(queue_size) for _ in range(workers)]
+    output    = context.Queue(queue_size)
+    processes = [
+        context.Process(target=_work, args=(inputs[i], output, options), daemon=True)
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    # A thread feeds the workers, so reading their output can't deadlock
+    stop   = threading.Event()
+    feeder = threading.Thread(target=_feed,
+                              args=(urls, inputs, batch_size, stop),
+                              daemon=True)
+    feeder.start()
+
+    running = workers
+    try:
+        while running:
+            try:
+                batch = output.get(timeout=1)
+            except Empty:
+                # A worker killed on the way can't say it's done
+                if not any(process.is_alive() for process in processes):
+                    raise RuntimeError('fetch_sharded workers exited unexpectedly')
+                continue
+
+            if batch is None:
+                running -= 1
+                continue
+            yield from batch
+    finally:
+        stop.set()
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        # Batches no worker will read mustn't hold the interpreter at exit
+        for queue in inputs:
+            queue.cancel_join_thread()
+            queue.close()
+
+
+def shard_of(url: str, shards: int) -> int:
+    """Stable shard of 'url' by host, the same in every process"""
+    return zlib.crc32(url_host(url).encode('utf-8')) % shards
+
+
+def _feed(urls       : Iterable[str],
+          inputs     : List[Any],
+          batch_size : int,
+          stop       : threading.Event,
+          ) -> None:
+    batches : List[List[str]] = [[] for _ in inputs]
+
+    def put(shard: int, batch: Optional[List[str]]) -> bool:
+        # Time out now and then to notice the consumer went away
+        while not stop.is_set():
+            try:
+                inputs[shard].put(batch, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    for url in urls:
+        shard = shard_of(url, len(inputs))
+        batches[shard].append(url)
+        if len(batches[shard]) >= batch_size:
+            if not put(shard, batches[shard]):
+                return
+            batches[shard] = []
+
+    for shard, batch in enumerate(batches):
+        if batch and not put(shard, batch):
+            return
+        if not put(shard, None):
+            return
+
+
+def _work(inbox   : Any,
+          outbox  : Any,
+          options : Dict[str, Any],
+          ) -> None:
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(_work_async(inbox, outbox, **options))
+    finally:
+        outbox.put(None)
+
+
+async def _work_async(inbox          : Any,
+                      outbox         : Any,
+                      max_concurrent : int = 1000,
+                      max_per_host   : int = None,
+                      raw            : bool = False,
+                      parse          : Callable[[Any], Any] = None,
+                      retry          : Retry = None,
+                      breaker        : CircuitBreaker = None,
+                      rate_limit     : RateLimiter = None,
+                      ) -> None:
+    scheduler = HostScheduler(max_concurrent, max_per_host, rate_limit)
+    # Not the default pool, a forked worker would inherit the parent's
+    pool      = SessionPool()
+
+    async def bound_fetch_one(url : str) -> Response:
+        async with scheduler.slot(url):
+            return await fetch_one(url,
+                                   session=pool.session(),
+                                   raw=raw,
+                                   retry=retry,
+                                   breaker=breaker,
+                                   rate_limit=rate_limit,
+                                   acquired=rate_limit is not None)
+
+    try:
+        await _pump(inbox, outbox, bound_fetch_one, max_concurrent, parse)
+    finally:
+        await pool.close()
+
+
+async def _pump(inbox          : Any,
+                outbox         : Any,
+                fetch          : Callable[[str], Awaitable[Response]],
+                max_concurrent : int,
+                parse          : Optional[Callable[[Any], Any]],
+                ) -> None:
+    loop = asyncio.get_event_loop()
+
+    # Like 'fetch_iter', but urls arrive from another process, so
+    # waiting for them must not stop the requests in flight
+    queued  : Deque[str] = deque()
+    running : Set[asyncio.Future] = set()
+    getter  : Optional[asyncio.Future] = None
+    done    = False
+
+    while not done or queued or running:
+        while queued and len(running) < max_concurrent:
+            running.add(asyncio.ensure_future(parsed(fetch(queued.popleft()), parse)))
+
+        # Ask for the next batch ahead of time, before the window drains
+        if not done and getter is None and len(queued) < max_concurrent:
+            getter = loop.run_in_executor(None, inbox.get)
+
+        waiting = running | ({getter} if getter is not None else set())
+        finished, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+        if getter is not None and getter in finished:
+            finished.discard(getter)
+            batch, getter = getter.result(), None
+            if batch is None:
+                done = True
+            else:
+                queued.extend(batch)
+
+        if finished:
+            running -= finished
+            responses = [_picklable(task.result()) for task in finished]
+            # Blocks while the consumer is behind, requests keep going meanwhile
+            await loop.run_in_executor(None, outbox.put, responses)
+
+
+def _picklable(response: Response) -> Response:
+    """
+    'response' as it can cross to the main process, anything in it that
+    doesn't pickle would make the queue drop the whole batch
+    """
+    if response.error is not None:
+        try:
+            pickle.loads(pickle.dumps(response.error))
+        except Exception:
+            # Some exceptions (eg: aiohttp's connection errors) don't
+            # survive pickling, keep their type and message at least
+            error = Exception(f'{type(response.error).__name__}: {response.error}')
+            return Response(response.url, error=error, timings=response.timings)
+        return response
+
+    try:
+        pickle.dumps(response)
+    except Exception as error:
+        # eg: 'parse=scrape(css=...)' gives lxml elements, parse to text instead
+        failure = TypeError(f"parse result isn't picklable, {type(error).__name__}: {error}")
+        return Response(response.url, error=failure, timings=response.timings)
+    return response
+
+    try:
+        pickle.loads(pickle.dumps(response.error))
+    except Exception:
+        # Some exceptions (eg: aiohttp's connection errors) don't
+        # survive pickling, keep their type and message at least
+        error = Exception(f'{type(response.error).__name__}: {response.error}')
+        return Response(response.url, error=error, timings=response.timings)
+    return response
@@ -0,0 +1,204 @@
+from typing import Any, Dict
+from abc import ABCMeta, abstractmethod
+
+import os
+import json
+import base64
+import hashlib
+import sqlite3
+import posixpath
+from urllib.parse import urlparse
+
+from .response import Response
+
+
+__all__ = [
+    'Sink', 'JsonLinesSink', 'SqliteSink', 'DirectorySink', 'record',
+]
+
+
+class Sink(metaclass=ABCMeta):
+    """
+    Destination for responses as they complete, so 'fetch' doesn't
+    keep them in memory, see 'fetch(urls, sink=...)'
+
+    Any object with a 'write(response)' method works as a sink,
+    'flush' is called once the batch is done, if there is one
+
+    'fetch' calls them from a thread of its own, one at a time and in
+    order, so blocking on the disk doesn't stall the event loop
+    """
+
+    @abstractmethod
+    def write(self, response: Response) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self) -> 'Sink':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def record(response: Response) -> Dict[str, Any]:
+    """
+    Plain fields of 'response': url, status, body, error and timings,
+    'body' is the result, which can be text, bytes or a parsed value
+    """
+    timings = response.timings
+    error   = response.error
+
+    return {
+        'url'     : response.url,
+        'status'  : timings.status if timings is not None else None,
+        'body'    : response.result,
+        'error'   : f'{type(error).__name__}: {error}' if error is not None else None,
+        'timings' : timings.as_dict() if timings is not None else None,
+    }
+
+
+class JsonLinesSink(Sink):
+    """
+    Appends a json line per response, bytes bodies are
+    base64 encoded and flagged with '"base64": true'
+
+    eg:
+
+    with JsonLinesSink('pages.jsonl') as sink:
+        summary = await fetch(urls, sink=sink)
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write(self, response: Response) -> None:
+        line = record(response)
+        if isinstance(line['body'], bytes):
+            line['body']   = base64.b64encode(line['body']).decode('ascii')
+            line['base64'] = True
+
+        self._file.write(json.dumps(line, default=str, ensure_ascii=False))
+        self._file.write('\n')
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class SqliteSink(Sink):
+    """
+    Inserts a row per response in 'table', committing every 'batch' rows,
+    bodies are stored as they are, text, bytes or json for parsed values
+
+    eg:
+
+    with SqliteSink('pages.sqlite') as sink:
+        summary = await fetch(urls, sink=sink)
+    """
+
+    def __init__(self,
+                 path  : str,
+                 table : str = 'responses',
+                 batch : int = 1000,
+                 ) -> None:
+        self.path  = path
+        self.table = table
+        self.batch = batch
+
+        self._pending = 0
+        # Written from 'fetch's thread, opened and closed from this one
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(f'''
+            CREATE TABLE IF NOT EXISTS "{table}" (
+                url     TEXT,
+                status  INTEGER,
+                body,
+                error   TEXT,
+                timings TEXT
+            )
+        ''')
+        self._db.commit()
+
+    def write(self, response: Response) -> None:
+        row  = record(response)
+        body = row['body']
+        if not isinstance(body, (str, bytes, type(None))):
+            body = json.dumps(body, default=str)
+
+        self._db.execute(f'INSERT INTO "{self.table}" VALUES (?, ?, ?, ?, ?)', (
+            row['url'],
+            row['status'],
+            body,
+            row['error'],
+            json.dumps(row['timings']),
+        ))
+
+        self._pending += 1
+        if self._pending >= self.batch:
+            self.flush()
+
+    def flush(self) -> None:
+        self._db.commit()
+        self._pending = 0
+
+    def close(self) -> None:
+        self.flush()
+        self._db.close()
+
+
+class DirectorySink(Sink):
+    """
+    Writes each successful body to its own file in 'path', named after
+    a hash of the url (keeping its extension), and a line per response
+    to '<path>/index.jsonl', with the file name, or the error
+
+    eg:
+
+    with DirectorySink('pages') as sink:
+        summary = await fetch(urls, sink=sink)
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._index = open(os.path.join(path, 'index.jsonl'), 'a', encoding='utf-8')
+
+    def write(self, response: Response) -> None:
+        line = record(response)
+        body = line.pop('body')
+
+        if response.error is None:
+            line['file'] = _file_name(response.url)
+            with open(os.path.join(self.path, line['file']), 'wb') as f:
+                f.write(_as_bytes(body))
+
+        self._index.write(json.dumps(line, default=str, ensure_ascii=False))
+        self._index.write('\n')
+
+    def flush(self) -> None:
+        self._index.flush()
+
+    def close(self) -> None:
+        self._index.close()
+
+
+def _file_name(url: str) -> str:
+    _, extension = posixpath.splitext(urlparse(url).path)
+    return hashlib.sha1(url.encode('utf-8')).hexdigest() + extension
+
+
+def _as_bytes(body: Any) -> bytes:
+    if isinstance(body, bytes):
+        return body
+    if isinstance(body, str):
+        return body.encode('utf-8')
+    return json.dumps(body, default=str).encode('utf-8')
@@ -0,0 +1,122 @@
+from typing import Any, Dict, Optional
+
+import time
+
+import aiohttp  # type: ignore
+
+
+__all__ = [
+    'Timings', 'trace_config',
+]
+
+
+class Timings:
+    """
+    Where the time of a request went, in seconds
+
+    'dns' and 'connect' are summed over the attempts and are 0 when a
+    pooled connection was reused, 'connect' includes the TLS handshake
+    (aiohttp doesn't report it apart), 'ttfb' and 'transfer' are from
+    the last attempt and 'total' spans all of them
+
+    'dns' and 'connect' need the session to carry 'trace_config()',
+    sessions from 'SessionPool' do
+    """
+
+    __slots__ = (
+        'dns', 'connect', 'ttfb', 'transfer', 'total',
+        'status', 'bytes', 'attempts', 'cached',
+        '_started', '_attempt_started', '_phase_started',
+    )
+
+    def __init__(self) -> None:
+        self.dns      = 0.0
+        self.connect  = 0.0
+        self.ttfb     : Optional[float] = None
+        self.transfer : Optional[float] = None
+        self.total    : Optional[float] = None
+        self.status   : Optional[int]   = None
+        self.bytes    = 0
+        self.attempts = 0
+        self.cached   = False
+
+        self._started         = time.monotonic()
+        self._attempt_started = self._started
+        self._phase_started   = self._started
+
+    @property
+    def retries(self) -> int:
+        return max(0, self.attempts - 1)
+
+    def attempt(self) -> None:
+        self.attempts += 1
+        self._attempt_started = time.monotonic()
+
+    def headers_received(self, status: int) -> None:
+        self.status = status
+        self.ttfb   = time.monotonic() - self._attempt_started
+
+    def body_received(self, size: int) -> None:
+        self.bytes = size
+        if self.ttfb is not None:
+            self.transfer = time.monotonic() - self._attempt_started - self.ttfb
+
+    @property
+    def elapsed(self) -> float:
+        """'total' once finished, the time so far until then"""
+        if self.total is not None:
+            return self.total
+        return time.monotonic() - self._started
+
+    def finish(self) -> 'Timings':
+        self.total = time.monotonic() - self._started
+        return self
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'dns'      : self.dns,
+            'connect'  : self.connect,
+            'ttfb'     : self.ttfb,
+            'transfer' : self.transfer,
+            'total'    : self.total,
+            'status'   : self.status,
+            'bytes'    : self.bytes,
+            'retries'  : self.retries,
+            'cached'   : self.cached,
+        }
+
+    def __repr__(self) -> str:
+        fields = ', '.join(f'{key}={value!r}' for key, value in self.as_dict().items())
+        return f'Timings({fields})'
+
+
+def trace_config() -> aiohttp.TraceConfig:
+    """
+    'aiohttp.TraceConfig' filling the 'Timings' passed to a request
+    as 'trace_request_ctx'
+    """
+    def timings(context: Any) -> Optional[Timings]:
+        value = context.trace_request_ctx
+        return value if isinstance(value, Timings) else None
+
+    async def phase_start(session: Any, context: Any, params: Any) -> None:
+        t = timings(context)
+        if t is not None:
+            t._phase_started = time.monotonic()
+
+    async def dns_end(session: Any, context: Any, params: Any) -> None:
+        t = timings(context)
+        if t is not None:
+            t.dns += time.monotonic() - t._phase_started
+
+    async def connection_end(session: Any, context: Any, params: Any) -> None:
+        t = timings(context)
+        if t is not None:
+            t.connect += time.monotonic() - t._phase_started
+
+    config = aiohttp.TraceConfig()
+    config.on_dns_resolvehost_start.append(phase_start)
+    config.on_dns_resolvehost_end.append(dns_end)
+    config.on_connection_create_start.append(phase_start)
+    config.on_connection_create_end.append(connection_end)
+    return config
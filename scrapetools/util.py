@@ -1,9 +1,9 @@
-from typing import TypeVar, Awaitable
+from typing import TypeVar, Awaitable, AsyncIterator, Iterator
 
 import os
 import posixpath
 import asyncio
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
 from itertools import accumulate
 
 
@@ -15,6 +15,18 @@ def run(coro: Awaitable[A]) -> A:
     return loop.run_until_complete(coro)
 
 
+def run_iter(agen: AsyncIterator[A]) -> Iterator[A]:
+    loop = asyncio.get_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(agen.__anext__())  # type: ignore
+            except StopAsyncIteration:
+                return
+    finally:
+        loop.run_until_complete(agen.aclose())  # type: ignore
+
+
 def sensible_download_path(url  : str,
                            path : str = None
                            ) -> str:
@@ -33,6 +45,47 @@ def url_basename(url: str) -> str:
     return posixpath.basename(urlparse(url).path)
 
 
+def url_host(url: str) -> str:
+    return urlparse(url).netloc.lower()
+
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url: str) -> str:
+    """
+    Canonical form of 'url', so equivalent urls compare equal:
+    lowercased scheme and host, no default port, no fragment,
+    sorted query and '/' for an empty path
+    """
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    host   = (parsed.hostname or '')
+
+    try:
+        port = parsed.port
+    except ValueError:
+        port = None
+    if port is not None and DEFAULT_PORTS.get(scheme) != port:
+        host = f'{host}:{port}'
+
+    if parsed.username:
+        auth = parsed.username
+        if parsed.password:
+            auth += f':{parsed.password}'
+        host = f'{auth}@{host}'
+
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+
+    return urlunparse((scheme,
+                       host,
+                       parsed.path or '/',
+                       parsed.params,
+                       query,
+                       '',
+                       ))
+
+
 def mkdirdeep(path: str) -> None:
     sections = path.split(os.sep)  # type: ignore
 
@@ -0,0 +1,285 @@
+from typing import (
+    Any, BinaryIO, Dict, Iterable, Iterator,
+    List, Optional, Tuple, Union,
+)
+import os
+import gzip
+import zlib
+import time
+import uuid
+import base64
+import asyncio
+import hashlib
+from io import BufferedIOBase
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp  # type: ignore
+
+from .errors import StatusError
+from .response import Response
+from .timing import Timings
+
+
+__all__ = [
+    'WarcWriter', 'read_warc',
+]
+
+
+MAX_FILE_SIZE = 2 ** 30
+BLOCK_SIZE    = 2 ** 20
+
+# aiohttp hands over the decoded body, so these no longer describe it
+DECODED_HEADERS = {b'transfer-encoding', b'content-encoding', b'content-length'}
+
+
+class WarcWriter:
+    """
+    Archives HTTP exchanges as WARC 1.0 request and response records,
+    each gzipped on its own, in files under 'directory' that roll over
+    once past 'max_size' bytes
+
+    Records are compressed and written in 'BLOCK_SIZE' pieces by a
+    single background thread, in the order they were archived, so
+    compression stays off the event loop and bodies aren't copied
+
+    aiohttp decodes chunked and compressed bodies, the archived headers
+    are adjusted to match the body as stored
+
+    eg:
+
+    with WarcWriter('crawl') as warc:
+        await fetch(urls, warc=warc)
+
+    for response in read_warc('crawl'):
+        scrape(response.result, css='a')
+    """
+
+    def __init__(self,
+                 directory : str,
+                 prefix    : str = 'scrapetools',
+                 max_size  : int = MAX_FILE_SIZE,
+                 ) -> None:
+        self.directory = directory
+        self.prefix    = prefix
+        self.max_size  = max_size
+
+        os.makedirs(directory, exist_ok=True)
+
+        self.paths    : List[str] = []
+        self._file    : Optional[BinaryIO] = None
+        self._written = 0
+        self._thread  = ThreadPoolExecutor(max_workers=1)
+
+    async def archive(self,
+                      response : aiohttp.ClientResponse,
+                      body     : bytes,
+                      ) -> None:
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(self._thread, self._archive,
+                                   str(response.url),
+                                   _request_block(response),
+                                   _response_head(response, len(body)),
+                                   body)
+
+    def close(self) -> None:
+        self._thread.shutdown(wait=True)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> 'WarcWriter':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def _archive(self,
+                 url     : str,
+                 request : bytes,
+                 head    : bytes,
+                 body    : bytes,
+                 ) -> None:
+        if self._file is None or self._written >= self.max_size:
+            self._roll()
+
+        request_id  = _record_id()
+        response_id = _record_id()
+
+        self._record('request', (request,), {
+            'WARC-Record-ID'     : request_id,
+            'WARC-Target-URI'    : url,
+            'WARC-Concurrent-To' : response_id,
+            'Content-Type'       : 'application/http; msgtype=request',
+        })
+        self._record('response', (head, body), {
+            'WARC-Record-ID'      : response_id,
+            'WARC-Target-URI'     : url,
+            'WARC-Payload-Digest' : _digest(body),
+            'Content-Type'        : 'application/http; msgtype=response',
+        })
+
+    def _roll(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+        stamp = time.strftime('%Y%m%d%H%M%S', time.gmtime())
+        path  = os.path.join(self.directory,
+                             f'{self.prefix}-{stamp}-{len(self.paths):05d}.warc.gz')
+
+        self.paths.append(path)
+        self._file    = open(path, 'wb')
+        self._written = 0
+
+        info = b'software: scrapetools\r\nformat: WARC File Format 1.0\r\n'
+        self._record('warcinfo', (info,), {
+            'WARC-Record-ID' : _record_id(),
+            'WARC-Filename'  : os.path.basename(path),
+            'Content-Type'   : 'application/warc-fields',
+        })
+
+    def _record(self,
+                kind    : str,
+                blocks  : Tuple[bytes, ...],
+                headers : Dict[str, str],
+                ) -> None:
+        digest = hashlib.sha1()
+        for block in blocks:
+            digest.update(block)
+
+        fields = {
+            'WARC-Type'         : kind,
+            'WARC-Date'         : time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            **headers,
+            'WARC-Block-Digest' : _digest_of(digest),
+            'Content-Length'    : str(sum(map(len, blocks))),
+        }
+        header = 'WARC/1.0\r\n' + ''.join(f'{key}: {value}\r\n' for key, value in fields.items())
+
+        # One gzip member per record, so records can be read on their own
+        compressor = zlib.compressobj(wbits=31)
+        pieces     = [header.encode('utf-8'), b'\r\n', *blocks, b'\r\n\r\n']
+        for piece in pieces:
+            view = memoryview(piece)
+            for start in range(0, len(view), BLOCK_SIZE):
+                self._write(compressor.compress(view[start:start + BLOCK_SIZE]))
+        self._write(compressor.flush())
+
+    def _write(self, data: bytes) -> None:
+        self._file.write(data)  # type: ignore
+        self._written += len(data)
+
+
+def read_warc(paths : Union[str, Iterable[str]],
+              raw   : bool = False,
+              ) -> Iterator[Response]:
+    """
+    Yields a 'Response' per response record in the archives at 'paths',
+    a file, a directory of '.warc.gz' files or several of either,
+    like 'fetch' would have returned it, without any network
+
+    eg:
+
+    for url, text, error in read_warc('crawl'):
+        scrape(text, css='a')
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+
+    for path in paths:
+        if os.path.isdir(path):
+            yield from read_warc(sorted(
+                os.path.join(path, name)
+                for name in os.listdir(path)
+                if name.endswith(('.warc', '.warc.gz'))
+            ), raw)
+            continue
+
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rb') as f:  # type: ignore
+            for headers, block in _records(f):
+                if headers.get('warc-type') == 'response':
+                    yield _to_response(headers['warc-target-uri'], block, raw)
+
+
+def _records(f: BufferedIOBase) -> Iterator[Tuple[Dict[str, str], bytes]]:
+    while True:
+        line = f.readline()
+        if not line:
+            return
+        if not line.strip():
+            continue
+
+        headers : Dict[str, str] = {}
+        for line in iter(f.readline, b'\r\n'):
+            if not line:
+                return
+            key, _, value = line.decode('utf-8').partition(':')
+            headers[key.strip().lower()] = value.strip()
+
+        yield headers, f.read(int(headers['content-length']))
+
+
+def _to_response(url: str, block: bytes, raw: bool) -> Response:
+    head, _, body = block.partition(b'\r\n\r\n')
+    status_line, *lines = head.decode('latin-1').split('\r\n')
+    status = int(status_line.split()[1])
+
+    headers = {}
+    for line in lines:
+        key, _, value = line.partition(':')
+        headers[key.strip().lower()] = value.strip()
+
+    timings        = Timings()
+    timings.status = status
+    timings.bytes  = len(body)
+
+    if status != 200:
+        return Response(url, error=StatusError(url, status, headers), timings=timings)
+
+    encoding = _charset(headers.get('content-type', ''))
+    if raw:
+        return Response(url, body, encoding=encoding, timings=timings)
+    return Response(url, body.decode(encoding or 'utf-8', errors='replace'), timings=timings)
+
+
+def _charset(content_type: str) -> Optional[str]:
+    for parameter in content_type.split(';')[1:]:
+        key, _, value = parameter.partition('=')
+        if key.strip().lower() == 'charset':
+            return value.strip().strip('"') or None
+    return None
+
+
+def _request_block(response: aiohttp.ClientResponse) -> bytes:
+    info   = response.request_info
+    target = info.url.raw_path_qs
+    lines  = [f'{info.method} {target} HTTP/1.1']
+    if 'Host' not in info.headers:
+        lines.append(f'Host: {info.url.raw_host}')
+    lines += [f'{key}: {value}' for key, value in info.headers.items()]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8')
+
+
+def _response_head(response: aiohttp.ClientResponse, size: int) -> bytes:
+    version = response.version or aiohttp.HttpVersion11
+    status  = f'HTTP/{version.major}.{version.minor} {response.status} {response.reason}'
+    lines   = [status.encode('latin-1')]
+    lines  += [
+        key + b': ' + value
+        for key, value in response.raw_headers
+        if key.lower() not in DECODED_HEADERS
+    ]
+    lines.append(f'Content-Length: {size}'.encode('latin-1'))
+    return b'\r\n'.join(lines) + b'\r\n\r\n'
+
+
+def _record_id() -> str:
+    return f'<urn:uuid:{uuid.uuid4()}>'
+
+
+def _digest(data: bytes) -> str:
+    return _digest_of(hashlib.sha1(data))
+
+
+def _digest_of(digest: Any) -> str:
+    return 'sha1:' + base64.b32encode(digest.digest()).decode('ascii')
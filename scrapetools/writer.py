@@ -0,0 +1,158 @@
+from typing import Any, List, Optional
+
+import os
+import asyncio
+from concurrent.futures import Executor
+
+
+__all__ = [
+    'FileWriter', 'allocate',
+]
+
+
+BUFFER_SIZE = 2 ** 20
+
+
+class FileWriter:
+    """
+    Writes a file without blocking the event loop
+
+    Chunks are coalesced in memory up to 'buffer_size' bytes and
+    flushed in 'executor' (the loop's default one if None), while the
+    next buffer fills up, so at most one write is outstanding at a time
+
+    Writes are positional, starting at 'offset', so several writers can
+    fill different ranges of the same file. When 'size' is known the file
+    is preallocated with 'os.posix_fallocate' where available, and with
+    'truncate=True' it is cut at the last written byte on close
+
+    eg:
+
+    async with FileWriter(path, size=content_length) as writer:
+        async for chunk in response.content.iter_any():
+            await writer.write(chunk)
+    """
+
+    def __init__(self,
+                 path        : str,
+                 size        : int  = None,
+                 offset      : int  = 0,
+                 truncate    : bool = True,
+                 buffer_size : int  = BUFFER_SIZE,
+                 executor    : Executor = None,
+                 ) -> None:
+        self.path        = path
+        self.size        = size
+        self.offset      = offset
+        self.truncate    = truncate
+        self.buffer_size = buffer_size
+        self.executor    = executor
+
+        self._fd       : Optional[int] = None
+        self._buffer   : List[bytes] = []
+        self._buffered = 0
+        self._pending  : Optional[asyncio.Future] = None
+
+    async def __aenter__(self) -> 'FileWriter':
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    async def open(self) -> None:
+        self._fd = await self._run(os.open, self.path, os.O_WRONLY | os.O_CREAT, 0o666)
+        if self.size:
+            await self._run(_preallocate, self._fd, self.offset, self.size - self.offset)
+
+    async def write(self, chunk: bytes) -> None:
+        self._buffer.append(chunk)
+        self._buffered += len(chunk)
+
+        if self._buffered >= self.buffer_size:
+            await self._flush()
+
+    async def close(self) -> None:
+        if self._fd is None:
+            return
+
+        try:
+            await self._flush()
+            await self._wait_pending()
+            if self.truncate:
+                self._pending = self._run(os.ftruncate, self._fd, self.offset)
+                await self._wait_pending()
+        finally:
+            fd, self._fd = self._fd, None
+            pending, self._pending = self._pending, None
+            if pending is not None and not pending.done():
+                # Cancelled while a thread still uses 'fd', close it once done
+                pending.add_done_callback(lambda _: _close(fd))
+            else:
+                os.close(fd)
+
+    async def _flush(self) -> None:
+        # Only one write in flight, so the next buffer can fill meanwhile
+        await self._wait_pending()
+
+        if not self._buffer:
+            return
+
+        data = b''.join(self._buffer)
+        self._buffer.clear()
+        self._buffered = 0
+
+        self._pending = self._run(_pwrite_all, self._fd, data, self.offset)
+        self.offset += len(data)
+
+    async def _wait_pending(self) -> None:
+        if self._pending is not None:
+            # Shielded, a cancelled wait keeps track of the write, as
+            # the thread carries on with it regardless
+            await asyncio.shield(self._pending)
+            self._pending = None
+
+    def _run(self, f: Any, *args: Any) -> asyncio.Future:
+        return asyncio.get_event_loop().run_in_executor(self.executor, f, *args)
+
+
+def allocate(path: str, size: int) -> None:
+    """
+    Sizes the file at 'path' to exactly 'size' bytes, creating it if
+    needed, and preallocates them, for writers to fill in place
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o666)
+    try:
+        os.ftruncate(fd, size)
+        _preallocate(fd, 0, size)
+    finally:
+        os.close(fd)
+
+
+def _close(fd: int) -> None:
+    try:
+        os.close(fd)
+    except OSError:
+        pass
+
+
+def _preallocate(fd: int, offset: int, length: int) -> None:
+    if length <= 0 or not hasattr(os, 'posix_fallocate'):
+        return
+    try:
+        os.posix_fallocate(fd, offset, length)
+    except OSError:
+        # Not supported by every filesystem, it is only an optimization
+        pass
+
+
+def _pwrite_all(fd: int, data: bytes, offset: int) -> None:
+    view = memoryview(data)
+    while view:
+        if hasattr(os, 'pwrite'):
+            written = os.pwrite(fd, view, offset)
+        else:
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, view)
+        view    = view[written:]
+        offset += written
@@ -7,5 +7,6 @@ setup(name='scrapetools',
       author='Beta Faccion',
       author_email='betafcc@gmail.com',
       packages=['scrapetools'],
-      install_requires=['aiohttp', 'tqdm', 'lxml', 'cssselect']
+      python_requires='>=3.10',
+      install_requires=['aiohttp>=3.8.6', 'tqdm', 'lxml', 'cssselect']
       )
@@ -1,14 +1,50 @@
-from flask import Flask, send_from_directory
+import time
+from collections import Counter
+
+from flask import Flask, Response, send_from_directory
 
 
 app = Flask(__name__)
 
+hits = Counter()
+
 
 @app.route('/')
 def index():
     return app.send_static_file('index.html')
 
 
+@app.route('/flaky/<int:failures>/<key>')
+def flaky(failures, key):
+    # Fails 'failures' times for each 'key' before succeeding
+    hits[key] += 1
+    if hits[key] <= failures:
+        return 'Unavailable', 503, {'Retry-After': '0'}
+    return app.send_static_file('index.html')
+
+
+@app.route('/graph/<int:node>')
+def graph(node):
+    # A binary tree of 63 pages, each also linking back to the root
+    children = [f'graph/{child}' for child in (2 * node, 2 * node + 1) if child < 64]
+    links    = children + ['/graph/1#top', 'http://example.com/', 'mailto:someone@example.com']
+    anchors  = ''.join(f'<a href="{link}">{link}</a>' for link in links)
+    return f'<html><head><base href="/"></head><body>{anchors}</body></html>'
+
+
+@app.route('/slow/<float:seconds>')
+def slow(seconds):
+    time.sleep(seconds)
+    return app.send_static_file('index.html')
+
+
+@app.route('/undeclared')
+def undeclared():
+    # No charset in the headers, the page declares it in a <meta>
+    body = '<html><head><meta charset="latin-1"></head><body>café</body></html>'
+    return Response(body.encode('latin-1'), content_type='text/html')
+
+
 @app.route('/<path:filename>')
 def static_files(filename):
     return send_from_directory('static', filename)
@@ -0,0 +1,66 @@
+import pytest
+
+import asyncio
+
+from .util import start_server
+
+from scrapetools.adaptive import AdaptiveLimiter
+from scrapetools.errors import StatusError
+from scrapetools.fetch import fetch
+from scrapetools.util import run
+
+
+@pytest.fixture(scope='module')
+def server():
+    server_process = start_server()
+    yield
+    server_process.terminate()
+
+
+def test_aimd():
+    limiter = AdaptiveLimiter(initial=4, max_limit=6, max_latency=1)
+
+    for _ in range(5):
+        limiter.record(0.01)
+    assert limiter.limit == 5
+
+    for _ in range(100):
+        limiter.record(0.01)
+    assert limiter.limit == 6
+
+    limiter.record(0.01, StatusError('u', 503))
+    assert limiter.limit == 3
+    # Same round, no second decrease
+    limiter.record(0.01, asyncio.TimeoutError())
+    assert limiter.limit == 3
+
+    # Client errors are neutral
+    limiter.record(0.01, StatusError('u', 404))
+    assert limiter.limit == 3
+
+
+def test_semaphore():
+    limiter = AdaptiveLimiter(initial=2)
+    peak = active = 0
+
+    async def job():
+        nonlocal peak, active
+        async with limiter:
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+
+    run(asyncio.gather(*(job() for _ in range(10))))
+    assert peak == 2
+    assert limiter.active == 0
+
+
+def test_fetch_adaptive(server):
+    limiter = AdaptiveLimiter(initial=2)
+
+    resps = run(fetch(['http://localhost:5000'] * 20, max_concurrent=limiter))
+
+    assert all(r.error is None for r in resps)
+    assert limiter.limit > 2
+    assert limiter.latency is not None
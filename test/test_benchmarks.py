@@ -0,0 +1,35 @@
+import pytest
+
+from benchmarks.server import start_server
+from benchmarks.suite import run_scenario
+
+
+@pytest.fixture(scope='module')
+def base_url():
+    server_process, base_url = start_server()
+    yield base_url
+    server_process.terminate()
+
+
+def test_fetch_all(base_url):
+    result = run_scenario('fetch_all', base_url, urls=50)
+    assert result['failed'] == 0
+    assert result['requests_per_second'] > 0
+
+    result = run_scenario('fetch_all_chunked', base_url, urls=50, size=2 ** 17)
+    assert result['failed'] == 0
+
+
+def test_download_all(base_url):
+    result = run_scenario('download_all_chunked', base_url, files=2, size=2 ** 17)
+    assert result['failed'] == 0
+    assert result['megabytes_per_second'] > 0
+
+
+def test_scrape():
+    result = run_scenario('scrape', documents=2, links=10)
+    assert result['documents_per_second'] > 0
+    assert result['peak_rss'] > 0
+
+    result = run_scenario('scrape_all', documents=2, links=10)
+    assert result['documents_per_second'] > 0
@@ -0,0 +1,60 @@
+import pytest
+
+import time
+
+from scrapetools.breaker import CircuitBreaker
+from scrapetools.errors import StatusError, CircuitOpenError
+from scrapetools.fetch import fetch
+from scrapetools.util import run
+
+
+def test_breaker():
+    breaker = CircuitBreaker(failures=2, cooldown=0.05)
+    url = 'http://a/x'
+
+    async def fail(error):
+        raise error
+
+    async def ok():
+        return 'ok'
+
+    for _ in range(2):
+        with pytest.raises(StatusError):
+            run(breaker.call(url, fail, StatusError(url, 503)))
+
+    assert breaker.is_open(url)
+    assert not breaker.is_open('http://b/x')
+    with pytest.raises(CircuitOpenError):
+        run(breaker.call(url, ok))
+
+    # Failed probe reopens right away
+    time.sleep(0.06)
+    with pytest.raises(StatusError):
+        run(breaker.call(url, fail, StatusError(url, 500)))
+    with pytest.raises(CircuitOpenError):
+        run(breaker.call(url, ok))
+
+    time.sleep(0.06)
+    assert run(breaker.call(url, ok)) == 'ok'
+    assert not breaker.is_open(url)
+
+
+def test_breaker_ignores_client_errors():
+    breaker = CircuitBreaker(failures=1)
+
+    async def not_found():
+        raise StatusError('http://a/x', 404)
+
+    with pytest.raises(StatusError):
+        run(breaker.call('http://a/x', not_found))
+    assert not breaker.is_open('http://a/x')
+
+
+def test_fetch_breaker():
+    breaker = CircuitBreaker(failures=2, cooldown=60)
+    dead = 'http://localhost:1/'
+
+    resps = run(fetch([dead] * 5, max_per_host=1, breaker=breaker))
+
+    errors = [type(r.error) for r in resps]
+    assert errors.count(CircuitOpenError) == 3
@@ -0,0 +1,96 @@
+import pytest
+
+from .util import start_server
+
+from scrapetools.cache import Cache
+from scrapetools.fetch import fetch
+from scrapetools.util import run
+
+
+@pytest.fixture(scope='module')
+def server():
+    server_process = start_server()
+    yield
+    server_process.terminate()
+
+
+@pytest.fixture
+def cache(tmpdir):
+    cache = Cache(str(tmpdir.join('cache.sqlite')))
+    yield cache
+    cache.close()
+
+
+def test_fetch_cached(server, cache):
+    url = 'http://localhost:5000/home.html'
+
+    first = run(fetch(url, cache=cache))
+    assert first.error is None
+    assert len(cache) == 1
+
+    entry = cache.get(url)
+    assert entry.etag or entry.last_modified
+
+    # Revalidated, served from disk on 304
+    second = run(fetch(url, cache=cache))
+    assert second.result == first.result
+
+    resps = run(fetch([url, 'http://LOCALHOST:5000/home.html#top'], cache=cache))
+    assert [r.result for r in resps] == [first.result] * 2
+    assert len(cache) == 1
+
+
+def test_fetch_raw_cached(server, cache):
+    url = 'http://localhost:5000/undeclared'
+
+    # Cached or not, only the declared charset is passed on
+    first  = run(fetch(url, cache=cache, raw=True))
+    second = run(fetch(url, cache=cache, raw=True))
+    assert first.encoding is None and second.encoding is None
+    assert second.result == first.result
+    assert cache.get(url).encoding is None
+
+
+def test_fresh_entry_skips_network(cache):
+    cache.ttl = 60
+    url = 'http://localhost:1/unreachable'
+    cache.put(url, 'cached'.encode('utf-8'), {}, encoding='utf-8')
+
+    url, result, error = run(fetch(url, cache=cache))
+    assert error is None
+    assert result == 'cached'
+
+
+def test_lru_eviction(cache):
+    cache.max_size = 10
+
+    cache.put('http://a/', b'12345', {})
+    cache.put('http://b/', b'12345', {})
+    cache.get('http://a/')
+    cache.put('http://c/', b'12345', {})
+
+    assert len(cache) == 2
+    assert cache.size <= 10
+    assert cache.get('http://b/') is None
+    assert cache.get('http://a/') is not None
+
+
+def test_reopen(tmpdir):
+    path = str(tmpdir.join('cache.sqlite'))
+
+    cache = Cache(path, batch=1000)
+    cache.put('http://a/', b'12345', {})
+    cache.put('http://b/', b'123', {})
+    cache.put('http://a/', b'1', {})
+    cache.get('http://a/')
+    assert cache.size == 4
+    cache.close()
+
+    # Pending writes and access times made it to disk
+    cache = Cache(path, max_size=3)
+    assert cache.size == 4
+    cache.put('http://c/', b'12', {})
+    assert cache.get('http://b/') is None
+    assert cache.get('http://a/') is not None
+    assert cache.size == 3
+    cache.close()
@@ -0,0 +1,107 @@
+import pytest
+
+from .util import start_server
+
+from scrapetools.crawl import BloomFilter, Frontier, crawl_sync, extract_links
+
+
+local_url = 'http://localhost:5000'
+
+
+@pytest.fixture(scope='module')
+def server():
+    server_process = start_server()
+    yield
+    server_process.terminate()
+
+
+def test_bloom_filter():
+    seen = BloomFilter(capacity=10000, error_rate=0.01)
+
+    assert all(seen.add(f'http://a.com/{i}') for i in range(1000))
+    assert not seen.add('http://a.com/1')
+    assert 'http://a.com/999' in seen
+    assert len(seen) == 1000
+
+    false_positives = sum(f'http://b.com/{i}' in seen for i in range(10000))
+    assert false_positives < 100
+    assert len(seen._bits) < 10000 * 2
+
+
+def test_extract_links():
+    document = '''<?xml version="1.0" encoding="utf-8"?>
+    <html><body>
+        <a href="b.html#x">b</a>
+        <a href="/c?z=1&amp;a=2">c</a>
+        <a href="HTTP://Example.com:80/b.html">b again</a>
+        <a href="javascript:void(0)">js</a>
+        <a name="anchor">no href</a>
+    </body></html>
+    '''
+    assert extract_links(document, 'http://example.com/a/') == [
+        'http://example.com/a/b.html',
+        'http://example.com/c?a=2&z=1',
+        'http://example.com/b.html',
+    ]
+    assert extract_links(b'', 'http://example.com/') == []
+
+
+def test_frontier(tmpdir):
+    path = str(tmpdir.join('frontier.sqlite'))
+
+    with Frontier(path) as frontier:
+        assert frontier.push(['http://a.com/2', 'http://a.com/1'], depth=1) == 2
+        assert frontier.push(['http://a.com/0', 'http://a.com/1'], depth=0) == 1
+        assert frontier.pop(2) == [('http://a.com/0', 0), ('http://a.com/2', 1)]
+        frontier.done(['http://a.com/0'])
+
+    # Popped but not done is queued again, seen urls stay seen
+    with Frontier(path) as frontier:
+        assert len(frontier) == 2
+        assert frontier.push(['http://a.com/0', 'http://a.com/3']) == 1
+        assert sorted(url for url, _ in frontier.pop(10)) == [
+            'http://a.com/1', 'http://a.com/2', 'http://a.com/3',
+        ]
+
+
+def test_crawl(server, tmpdir):
+    path = str(tmpdir.join('crawl.sqlite'))
+
+    responses = list(crawl_sync(f'{local_url}/graph/1', frontier=path, batch_size=10))
+
+    urls = sorted(response.url for response in responses)
+    assert urls == sorted(f'{local_url}/graph/{node}' for node in range(1, 64))
+    assert all(response.error is None for response in responses)
+
+
+def test_crawl_resume(server, tmpdir):
+    path = str(tmpdir.join('crawl.sqlite'))
+
+    first = [response.url for response in
+             crawl_sync(f'{local_url}/graph/1', frontier=path, max_pages=10, batch_size=4)]
+    assert len(first) == 10
+    # Breadth first
+    assert sorted(first[:3]) == [f'{local_url}/graph/{node}' for node in (1, 2, 3)]
+
+    rest = [response.url for response in
+            crawl_sync(f'{local_url}/graph/1', frontier=path)]
+    assert not set(first) & set(rest)
+    assert len(first) + len(rest) == 63
+
+
+def test_crawl_max_depth(server, tmpdir):
+    path = str(tmpdir.join('crawl.sqlite'))
+
+    responses = list(crawl_sync(f'{local_url}/graph/1', frontier=path, max_depth=2))
+    assert len(responses) == 7
+
+
+def test_crawl_slow_page(server, tmpdir):
+    path = str(tmpdir.join('crawl.sqlite'))
+    slow = f'{local_url}/slow/1.5'
+
+    responses = list(crawl_sync([slow, f'{local_url}/graph/1'], frontier=path, batch_size=10))
+
+    # The rest of the graph is crawled while the slow page is in flight
+    assert len(responses) == 64
+    assert responses[-1].url == slow
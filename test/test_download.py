@@ -1,6 +1,11 @@
 import pytest
 
+import os
+import json
+import asyncio
+from importlib import import_module
 from shutil import rmtree
+from urllib.request import urlopen
 from os import mkdir, listdir
 from os.path import abspath, dirname, join
 
@@ -8,11 +13,14 @@ from .util import start_server
 from scrapetools.util import run
 
 from scrapetools.download import download
+from scrapetools.resume import PartFile
+download_module = import_module('scrapetools.download')
 
 
 __dirname = abspath(dirname(__file__))
 
 DOWNLOAD_DIR = abspath(join(__dirname, 'downloaded'))
+STATIC_DIR   = abspath(join(__dirname, 'server', 'static', 'download'))
 
 
 local_url = 'http://localhost:5000'
@@ -104,3 +112,140 @@ def test_download_all_empty(server, download_dir, show_progress):
 
     ls = listdir(DOWNLOAD_DIR)
     assert len(ls) == 0
+
+
+def _prepare_part(name, content, etag):
+    path = join(DOWNLOAD_DIR, name)
+    with open(path + '.part', 'wb') as fd:
+        fd.write(content)
+    with open(path + '.part.json', 'w') as fd:
+        json.dump({'etag': etag}, fd)
+    return path
+
+
+@pytest.mark.parametrize('valid_etag', [True, False])
+def test_download_resume(server, download_dir, valid_etag):
+    with open(join(STATIC_DIR, 'brown.txt'), 'rb') as fd:
+        original = fd.read()
+
+    etag = urlopen(urls['brown.txt']).headers['ETag'] if valid_etag else '"stale"'
+    # On a stale etag the server sends the whole file, so a wrong prefix is harmless
+    prefix = original[:100] if valid_etag else b'x' * 100
+    path = _prepare_part('brown.txt', prefix, etag)
+
+    run(download(urls['brown.txt'], DOWNLOAD_DIR, resume=True))
+
+    assert listdir(DOWNLOAD_DIR) == ['brown.txt']
+    with open(path, 'rb') as fd:
+        assert fd.read() == original
+
+
+def test_download_resume_after_crash(server, download_dir, monkeypatch):
+    read_chunks = download_module.read_chunks
+
+    async def interrupted(response):
+        async for chunk in read_chunks(response):
+            yield chunk
+            raise ConnectionResetError('killed')
+
+    async def close_untidily(writer):
+        # A killed process doesn't get to truncate the file
+        await writer._flush()
+        await writer._wait_pending()
+        os.close(writer._fd)
+        writer._fd = None
+
+    monkeypatch.setattr(download_module, 'read_chunks', interrupted)
+    monkeypatch.setattr(download_module.FileWriter, 'close', close_untidily)
+
+    with pytest.raises(ConnectionResetError):
+        run(download(urls['genesis.txt'], DOWNLOAD_DIR, resume=True))
+
+    path = join(DOWNLOAD_DIR, 'genesis.txt')
+    written = os.path.getsize(path + '.part')
+    assert 0 < written < os.path.getsize(join(STATIC_DIR, 'genesis.txt'))
+
+    monkeypatch.undo()
+    ranges = []
+    get = download_module.aiohttp.ClientSession.get
+
+    def spy(session, url, headers=None, **kwargs):
+        ranges.append((headers or {}).get('Range'))
+        return get(session, url, headers=headers, **kwargs)
+
+    monkeypatch.setattr(download_module.aiohttp.ClientSession, 'get', spy)
+    run(download(urls['genesis.txt'], DOWNLOAD_DIR, resume=True))
+
+    assert ranges == [f'bytes={written}-']
+    with open(join(STATIC_DIR, 'genesis.txt'), 'rb') as original, open(path, 'rb') as fd:
+        assert fd.read() == original.read()
+
+
+def test_part_file_resumes(tmpdir):
+    part = PartFile(str(tmpdir.join('file')))
+    with open(part.part, 'wb') as fd:
+        fd.write(b'x' * 100)
+
+    class Partial:
+        status  = 206
+        url     = 'http://x.com/file'
+        headers = {'Content-Range': 'bytes 50-199/200'}
+
+    assert not part.resumes(Partial())
+    with pytest.raises(ValueError):
+        part.start(Partial())
+
+    Partial.headers = {'Content-Range': 'bytes 100-199/200'}
+    assert part.resumes(Partial())
+    assert part.start(Partial()) == 100
+
+
+def test_download_all_resume(server, download_dir):
+    run(download(urls.values(), DOWNLOAD_DIR, resume=True))
+
+    assert set(listdir(DOWNLOAD_DIR)) == set(urls.keys())
+
+
+def test_download_segmented(server, download_dir, monkeypatch):
+    monkeypatch.setattr(download_module, 'MIN_SEGMENT_SIZE', 10000)
+
+    for name in files:
+        run(download(urls[name], DOWNLOAD_DIR, segments=4))
+
+        with open(join(STATIC_DIR, name), 'rb') as original, \
+                open(join(DOWNLOAD_DIR, name), 'rb') as downloaded:
+            assert downloaded.read() == original.read()
+
+
+def test_download_segmented_over_larger_file(server, download_dir, monkeypatch):
+    monkeypatch.setattr(download_module, 'MIN_SEGMENT_SIZE', 10000)
+    path = join(DOWNLOAD_DIR, 'brown.txt')
+    with open(path, 'wb') as fd:
+        fd.write(b'x' * 500000)
+
+    run(download(urls['brown.txt'], DOWNLOAD_DIR, segments=4))
+
+    with open(join(STATIC_DIR, 'brown.txt'), 'rb') as original, open(path, 'rb') as fd:
+        assert fd.read() == original.read()
+
+
+def test_download_segmented_failure(server, download_dir, monkeypatch):
+    monkeypatch.setattr(download_module, 'MIN_SEGMENT_SIZE', 10000)
+
+    async def segment(url, path, session, start, end, validator, metrics):
+        if start == 0:
+            raise ConnectionResetError('failed')
+        # A slower segment retrying after the failure
+        await asyncio.sleep(0.2)
+        async with download_module.FileWriter(path, offset=start, truncate=False) as writer:
+            await writer.write(b'x')
+
+    monkeypatch.setattr(download_module, '_download_segment', segment)
+
+    async def failing():
+        with pytest.raises(ConnectionResetError):
+            await download(urls['brown.txt'], DOWNLOAD_DIR, segments=4)
+        await asyncio.sleep(0.3)
+
+    run(failing())
+    assert listdir(DOWNLOAD_DIR) == []
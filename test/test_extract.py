@@ -0,0 +1,72 @@
+import pytest
+
+import pickle
+
+from scrapetools.extract import Extractor, Field
+from scrapetools.response import Response
+
+
+products = '''
+<html><head><title>Shop</title></head><body>
+    <div class="product">
+        <h2> Lamp </h2>
+        <span class="price">9.99</span>
+        <a href="/lamp">more</a>
+        <span class="tag">home</span><span class="tag">light</span>
+    </div>
+    <div class="product">
+        <h2>Chair</h2>
+        <a href="chair?color=red">more</a>
+    </div>
+</body></html>
+'''
+
+
+def test_rows():
+    extract = Extractor(rows='div.product', fields={
+        'name'  : 'h2',
+        'price' : ('.price', 'text()', float),
+        'url'   : ('a', '@href'),
+        'tags'  : Field('.tag', many=True),
+        'count' : (None, 'count(.//span)', int),
+    }, base_url='http://shop.com/items/')
+
+    assert extract(products) == [
+        {
+            'name'  : 'Lamp',
+            'price' : 9.99,
+            'url'   : 'http://shop.com/lamp',
+            'tags'  : ['home', 'light'],
+            'count' : 3,
+        },
+        {
+            'name'  : 'Chair',
+            'price' : None,
+            'url'   : 'http://shop.com/items/chair?color=red',
+            'tags'  : [],
+            'count' : 0,
+        },
+    ]
+
+
+def test_document():
+    extract = Extractor({
+        'title' : 'title',
+        'links' : Field('a', '@href', many=True),
+        'price' : Field('.nothing', default=0),
+    })
+
+    response = Response('http://shop.com/', products.encode('utf-8'), encoding='utf-8')
+    assert extract(response) == [{
+        'title' : 'Shop',
+        'links' : ['http://shop.com/lamp', 'http://shop.com/chair?color=red'],
+        'price' : 0,
+    }]
+
+    with pytest.raises(KeyError):
+        extract(Response('http://shop.com/', error=KeyError('failed')))
+
+
+def test_pickle():
+    extract = Extractor(rows='div.product', fields={'name': 'h2', 'url': ('a', '@href')})
+    assert pickle.loads(pickle.dumps(extract))(products) == extract(products)
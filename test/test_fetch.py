@@ -2,7 +2,7 @@ import pytest
 
 from .util import start_server
 
-from scrapetools.fetch import fetch
+from scrapetools.fetch import fetch, fetch_iter_sync
 from scrapetools.util import run
 
 
@@ -40,3 +40,42 @@ def test_fetch_all(server):
     resps = run(fetch([index, home]))
 
     assert len(resps) == 2
+
+
+def test_fetch_iter(server):
+    index = 'http://localhost:5000'
+    home  = 'http://localhost:5000/home.html'
+    urls  = [index, home, index + '/foo'] * 3
+
+    resps = list(fetch_iter_sync(iter(urls), max_concurrent=2))
+    assert len(resps) == len(urls)
+    assert sorted(r.url for r in resps) == sorted(urls)
+
+    resps = list(fetch_iter_sync(urls, max_concurrent=2, ordered=True))
+    assert [r.url for r in resps] == urls
+    assert all(r.error is None for r in resps if not r.url.endswith('foo'))
+
+
+def test_fetch_iter_early_stop(server):
+    index = 'http://localhost:5000'
+
+    def urls():
+        while True:
+            yield index
+
+    for i, resp in enumerate(fetch_iter_sync(urls(), max_concurrent=3)):
+        assert resp.error is None
+        if i == 4:
+            break
+
+
+def test_fetch_raw(server):
+    url, body, err = resp = run(fetch('http://localhost:5000/home.html', raw=True))
+
+    assert err is None
+    assert isinstance(body, bytes)
+    assert resp.encoding == 'utf-8'
+    assert b'Home Page' in body
+
+    resps = run(fetch(['http://localhost:5000/home.html'], raw=True))
+    assert isinstance(resps[0].result, bytes)
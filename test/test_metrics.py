@@ -0,0 +1,117 @@
+import pytest
+
+from uuid import uuid4
+
+from .util import start_server
+
+from scrapetools.errors import StatusError
+from scrapetools.fetch import fetch
+from scrapetools.metrics import LatencyHistogram, Metrics, MetricsBar
+from scrapetools.util import run
+
+from scrapetools.download import download
+
+
+local_url = 'http://localhost:5000'
+
+
+@pytest.fixture(scope='module')
+def server():
+    server_process = start_server()
+    yield
+    server_process.terminate()
+
+
+def test_histogram():
+    histogram = LatencyHistogram(precision=0.01, bounds=[0.1, 1.0, 10.0])
+    for ms in range(1, 1001):
+        histogram.add(ms / 1000)
+
+    assert histogram.count == 1000
+    assert histogram.quantile(0.5) == pytest.approx(0.5, rel=0.01)
+    assert histogram.quantile(0.99) == pytest.approx(0.99, rel=0.01)
+    assert histogram.quantile(1) == 1.0
+    assert histogram.cumulative() == [100, 1000, 1000]
+
+
+def test_metrics():
+    metrics = Metrics()
+    metrics.started()
+    metrics.started()
+    assert metrics.in_flight == 2
+
+    metrics.finished(0.1, size=100)
+    metrics.finished(0.2, StatusError('u', 503))
+
+    snapshot = metrics.snapshot()
+    assert snapshot['requests'] == 2
+    assert snapshot['in_flight'] == 0
+    assert snapshot['bytes'] == 100
+    assert snapshot['errors'] == {'status_503': 1}
+    assert snapshot['error_rate'] == 0.5
+    assert snapshot['latency']['max'] == 0.2
+
+
+def test_parent():
+    parent = Metrics()
+    child  = Metrics(parent=parent)
+
+    child.started()
+    child.add_bytes(10)
+    child.finished(0.1, ConnectionError())
+
+    assert (parent.requests, parent.bytes) == (1, 10)
+    assert parent.errors == {'ConnectionError': 1}
+
+
+def test_prometheus():
+    metrics = Metrics()
+    metrics.started()
+    metrics.finished(0.3, StatusError('u', 404), size=5)
+
+    text = metrics.prometheus()
+    assert 'scrapetools_requests_total 1\n' in text
+    assert 'scrapetools_bytes_total 5\n' in text
+    assert 'scrapetools_errors_total{kind="status_404"} 1\n' in text
+    assert 'scrapetools_request_duration_seconds_bucket{le="0.25"} 0\n' in text
+    assert 'scrapetools_request_duration_seconds_bucket{le="0.5"} 1\n' in text
+    assert 'scrapetools_request_duration_seconds_count 1\n' in text
+
+
+def test_fetch_metrics(server):
+    metrics = Metrics()
+    urls = [f'{local_url}/home.html', f'{local_url}/missing.html']
+
+    responses = run(fetch(urls, metrics=metrics, show_progress=True))
+
+    assert metrics.requests == 2
+    assert metrics.in_flight == 0
+    assert metrics.bytes == len(responses[0].result.encode('utf-8'))
+    assert metrics.errors == {'status_404': 1}
+
+
+def test_download_metrics(server, tmpdir):
+    metrics = Metrics()
+    path = str(tmpdir.join(uuid4().hex))
+
+    response = run(download(f'{local_url}/download/lorem.txt', path,
+                            metrics=metrics, show_progress=True))
+
+    assert metrics.requests == 1
+    assert metrics.bytes == response.timings.bytes
+
+
+def test_bar_counts_after_entering():
+    metrics = Metrics()
+    metrics.started()
+    metrics.finished(0.1)
+
+    async def render():
+        async with MetricsBar(metrics, total=1, disable=True) as bar:
+            metrics.started()
+            metrics.finished(0.1)
+        return bar
+
+    bar = run(render())
+    bar.render()
+    assert bar._pbar.n == 1
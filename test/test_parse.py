@@ -0,0 +1,57 @@
+import pytest
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from .util import start_server
+
+from scrapetools.fetch import fetch, fetch_iter_sync
+from scrapetools.parse import parse_response
+from scrapetools.response import Response
+from scrapetools.scrape import scrape
+from scrapetools.util import run
+
+
+@pytest.fixture(scope='module')
+def server():
+    server_process = start_server()
+    yield
+    server_process.terminate()
+
+
+index = 'http://localhost:5000'
+home  = 'http://localhost:5000/home.html'
+body_text = scrape(css='body', xpath='text()')
+
+
+def test_parse_response():
+    resp = run(parse_response(Response('u', '<html><body>hi</body></html>'), body_text))
+    assert resp.result == ['hi']
+
+    failed = Response('u', error=ValueError())
+    assert run(parse_response(failed, body_text)) is failed
+
+    resp = run(parse_response(Response('u', 'x'), lambda _: 1 / 0))
+    assert isinstance(resp.error, ZeroDivisionError)
+
+
+def test_fetch_parse_thread_pool(server):
+    with ThreadPoolExecutor(2) as executor:
+        resps = run(fetch([index, home, index + '/foo'],
+                          parse=body_text,
+                          executor=executor))
+
+    assert resps[0].result[0].strip() == 'Hello World'
+    assert resps[1].result[0].strip() == 'Home Page'
+    assert resps[2].error is not None
+
+    assert run(fetch(home, parse=body_text)).result[0].strip() == 'Home Page'
+
+
+def test_fetch_iter_parse_process_pool(server):
+    with ProcessPoolExecutor(2) as executor:
+        resps = list(fetch_iter_sync([index, home],
+                                     ordered=True,
+                                     parse=body_text,
+                                     executor=executor))
+
+    assert [r.result[0].strip() for r in resps] == ['Hello World', 'Home Page']
@@ -0,0 +1,115 @@
+import pytest
+
+import time
+import asyncio
+
+import aiohttp
+
+from .util import start_server
+
+from scrapetools.fetch import fetch, fetch_all
+from scrapetools.ratelimit import TokenBucket, RateLimiter
+from scrapetools.retry import Retry
+from scrapetools.util import run
+
+
+@pytest.fixture(scope='module')
+def server():
+    server_process = start_server()
+    yield
+    server_process.terminate()
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=10, burst=2)
+
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    # Reservations are scheduled back to back, 0.1s apart
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+
+
+def test_rate_limiter_keys():
+    limiter = RateLimiter(per_key=1, rates={'fast': 1000}, burst=1)
+    stamps = {}
+
+    async def request(url):
+        await limiter.acquire(url)
+        stamps.setdefault(url, []).append(time.monotonic())
+
+    start = time.monotonic()
+    run(asyncio.gather(
+        *(request('http://fast/') for _ in range(5)),
+        request('http://slow/'),
+        request('http://other/'),
+    ))
+
+    # Hosts have their own buckets, the overridden one isn't throttled
+    assert time.monotonic() - start < 0.5
+    assert limiter.bucket('http://fast/').rate == 1000
+    assert limiter.bucket('http://slow/').rate == 1
+
+
+def test_fetch_rate_limit(server):
+    urls = ['http://localhost:5000'] * 6
+
+    start = time.monotonic()
+    resps = run(fetch(urls, rate_limit=RateLimiter(rate=20, burst=1)))
+
+    assert all(r.error is None for r in resps)
+    assert time.monotonic() - start >= 5 / 20
+
+
+def test_rate_limit_outside_slots(server):
+    # Requests waiting on their host's token don't hold the slots
+    limiter = RateLimiter(key=lambda url: url.rsplit('?', 1)[-1],
+                          rates={'slow': 2, 'fast': 1000})
+    urls = ['http://localhost:5000/?slow'] * 4 + ['http://localhost:5000/?fast'] * 4
+
+    start = time.monotonic()
+    resps = run(fetch_all(urls, max_concurrent=2, rate_limit=limiter,
+                          parse=lambda text: time.monotonic() - start))
+
+    stamps = {}
+    for response in resps:
+        stamps.setdefault(response.url, []).append(response.result)
+
+    assert max(stamps['http://localhost:5000/?fast']) < 0.5
+    assert max(stamps['http://localhost:5000/?slow']) >= 3 / 2
+
+
+def test_rate_limit_retries(server):
+    limiter = RateLimiter(rate=10, burst=1)
+    retry   = Retry(attempts=3, backoff=0, statuses={404})
+
+    start = time.monotonic()
+    resps = run(fetch(['http://localhost:5000/404'], retry=retry, rate_limit=limiter))
+
+    # The first token is taken before the slot, each retry takes one more
+    assert resps[0].error is not None
+    assert time.monotonic() - start >= 2 / 10
+
+
+def test_rate_limit_at_send(server):
+    # Requests held back by a busy slot still go out at their rate
+    limiter = RateLimiter(key=lambda url: url.rsplit('?', 1)[-1], rates={'A': 4})
+    urls    = ['http://localhost:5000/slow/1.0'] + ['http://localhost:5000/?A'] * 4
+    sent    = []
+
+    async def on_request_start(session, context, params):
+        if str(params.url).endswith('?A'):
+            sent.append(time.monotonic())
+
+    async def fetch_traced():
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(on_request_start)
+        async with aiohttp.ClientSession(trace_configs=[trace]) as session:
+            return await fetch_all(urls, session=session, max_concurrent=1,
+                                   rate_limit=limiter)
+
+    resps = run(fetch_traced())
+
+    assert all(r.error is None for r in resps)
+    gaps = [later - earlier for earlier, later in zip(sent, sent[1:])]
+    assert len(gaps) == 3 and min(gaps) >= 0.2
@@ -0,0 +1,64 @@
+import pytest
+
+from uuid import uuid4
+
+from .util import start_server
+
+from scrapetools.errors import StatusError
+from scrapetools.fetch import fetch
+from scrapetools.retry import Retry
+from scrapetools.util import run
+
+
+@pytest.fixture(scope='module')
+def server():
+    server_process = start_server()
+    yield
+    server_process.terminate()
+
+
+def flaky_url(failures):
+    return f'http://localhost:5000/flaky/{failures}/{uuid4().hex}'
+
+
+def test_call():
+    calls = []
+
+    async def flaky(error):
+        calls.append(error)
+        if len(calls) < 3:
+            raise error
+        return 'ok'
+
+    retry = Retry(attempts=3, backoff=0)
+    assert run(retry.call(flaky, StatusError('u', 503))) == 'ok'
+    assert len(calls) == 3
+
+    calls.clear()
+    with pytest.raises(StatusError):
+        run(retry.call(flaky, StatusError('u', 404)))
+    assert len(calls) == 1
+
+
+def test_delay():
+    retry = Retry(backoff=1, max_backoff=5, jitter=False)
+
+    assert [retry.delay(n, ConnectionError()) for n in (1, 2, 3, 4)] == [1, 2, 4, 5]
+    assert retry.delay(1, StatusError('u', 429, {'Retry-After': '3'})) == 3
+    assert retry.delay(1, StatusError('u', 429, {'Retry-After': 'garbage'})) == 1
+
+    jittered = Retry(backoff=1, max_backoff=5)
+    assert all(0 <= jittered.delay(3, ConnectionError()) <= 4 for _ in range(100))
+
+
+def test_fetch_retry(server):
+    url, result, error = run(fetch(flaky_url(2), retry=Retry(attempts=3)))
+    assert error is None
+    assert result
+
+    url, result, error = run(fetch(flaky_url(2), retry=Retry(attempts=2)))
+    assert isinstance(error, StatusError)
+    assert error.status == 503
+
+    resps = run(fetch([flaky_url(1), flaky_url(1)], retry=Retry()))
+    assert all(r.error is None for r in resps)
@@ -0,0 +1,63 @@
+import asyncio
+
+from scrapetools.schedule import HostScheduler
+from scrapetools.util import run
+
+
+def test_limits():
+    scheduler = HostScheduler(max_concurrent=4, max_per_host=2)
+    peak = {'total': 0, 'a': 0, 'b': 0, 'c': 0}
+    active = {'total': 0, 'a': 0, 'b': 0, 'c': 0}
+
+    async def job(host):
+        async with scheduler.slot(f'http://{host}/x'):
+            for key in ('total', host):
+                active[key] += 1
+                peak[key] = max(peak[key], active[key])
+            await asyncio.sleep(0.01)
+            for key in ('total', host):
+                active[key] -= 1
+
+    hosts = ['a'] * 10 + ['b'] * 5 + ['c'] * 5
+    run(asyncio.gather(*map(job, hosts)))
+
+    assert peak['total'] == 4
+    assert peak['a'] == peak['b'] == peak['c'] == 2
+    assert scheduler.active == 0
+
+
+def test_round_robin():
+    scheduler = HostScheduler(max_concurrent=1)
+    order = []
+
+    async def job(host):
+        async with scheduler.slot(f'http://{host}/x'):
+            order.append(host)
+            await asyncio.sleep(0)
+
+    async def main():
+        # Hold the only slot so every job queues up first
+        async with scheduler.slot('http://z/x'):
+            jobs = asyncio.gather(*map(job, ['a'] * 3 + ['b'] * 3 + ['c'] * 3))
+            await asyncio.sleep(0)
+        await jobs
+
+    run(main())
+
+    assert order == ['a', 'b', 'c'] * 3
+
+
+def test_cancel_waiter():
+    scheduler = HostScheduler(max_concurrent=1)
+
+    async def main():
+        async with scheduler.slot('http://a/x'):
+            waiter = asyncio.ensure_future(scheduler.acquire('b'))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.sleep(0)
+        assert scheduler.active == 0
+        async with scheduler.slot('http://b/x'):
+            assert scheduler.active == 1
+
+    run(main())
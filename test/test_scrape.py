@@ -1,8 +1,14 @@
 import pytest
 
+from lxml import html
+
 from .util import start_server
 
-from scrapetools.scrape import scrape
+from scrapetools.response import Response
+from scrapetools.scrape import (
+    scrape, scrape_all, scrape_iter, scrape_stream_sync, compile_css, compile_xpath,
+    _parsed, _query, _select,
+)
 
 
 @pytest.fixture(scope='module')
@@ -46,3 +52,155 @@ def test_request_and_parse(server):
     assert scraped
     assert len(scraped) == 1
     assert scraped[0].strip() == 'Hello World'
+
+
+def test_compiled_selectors():
+    assert compile_css('li') is compile_css('li')
+    assert compile_xpath('.//text()') is compile_xpath('.//text()')
+
+    ul = '<ul><li><a href="/a">A</a></li><li><a href="/b">B</a></li></ul>'
+    get_hrefs = scrape(css='li', xpath='a/@href', base_url='http://x.com')
+
+    assert get_hrefs(ul) == ['http://x.com/a', 'http://x.com/b']
+    assert scrape(ul, css='li', xpath='.//text()', flatten=False) == [['A'], ['B']]
+
+
+def test_parse_bytes():
+    doc = '<p>café</p>'
+
+    assert scrape(doc.encode('latin-1'), xpath='//p/text()', encoding='latin-1') == ['café']
+    assert scrape(doc.encode('utf-8'), xpath='//p/text()', encoding='utf-8') == ['café']
+    assert scrape(doc.encode('utf-8'), xpath='//p/text()', encoding='bogus')
+
+    assert scrape(xpath='//p/text()', encoding='utf-8')(doc.encode('utf-8')) == ['café']
+
+
+def test_scrape_stream(server):
+    url = 'http://localhost:5000/list.html'
+
+    titles = scrape_stream_sync(url, css='title', xpath='text()', limit=1, chunk_size=64)
+    assert titles == ['List']
+
+    links = scrape_stream_sync(url, css='li a', xpath='@href', limit=3, chunk_size=64)
+    assert links == [f'http://localhost:5000/item/{i}' for i in (1, 2, 3)]
+
+    texts = scrape_stream_sync(url, xpath='//li/a/text()', limit=2, chunk_size=64)
+    assert texts == ['Item 1', 'Item 2']
+
+    # Without limit the whole document is read
+    assert len(scrape_stream_sync(url, css='li')) == len(scrape(url, css='li')) == 200
+
+
+def test_scrape_all():
+    pages = [
+        f'<title>Page {i}</title><a href="/{i}">{i}</a><a href="/next">next</a>'
+        for i in range(100)
+    ]
+    documents = [Response(f'http://x.com/{i}/', page.encode('utf-8'), encoding='utf-8')
+                 for i, page in enumerate(pages)]
+    documents.append(Response('http://x.com/missing', error=Exception('404')))
+
+    columns = scrape_all(documents, {
+        'title' : ('title', 'text()'),
+        'links' : ('a', '@href'),
+        'count' : (None, 'count(//a)'),
+        'body'  : 'body',
+    }, workers=4)
+
+    assert list(columns) == ['title', 'links', 'count', 'body']
+    assert all(len(column) == 101 for column in columns.values())
+    assert columns['title'][:2] == [['Page 0'], ['Page 1']]
+    assert columns['links'][3] == ['http://x.com/3', 'http://x.com/next']
+    assert type(columns['links'][3][0]) is str
+    assert columns['count'][0] == 2
+    assert len(columns['body'][0]) == 1
+    assert all(isinstance(column[-1], Exception) for column in columns.values())
+
+    # Same results as one 'scrape' at a time
+    assert columns['links'][:100] == [
+        scrape(page, css='a', xpath='@href', base_url=f'http://x.com/{i}/')
+        for i, page in enumerate(pages)
+    ]
+
+
+def test_scrape_iter():
+    def documents():
+        for i in range(1000):
+            yield f'<p>{i}</p>'
+
+    rows = scrape_iter(documents(), {'text': ('p', 'text()')}, workers=2)
+
+    assert [row.result['text'] for row in rows] == [[str(i)] for i in range(1000)]
+
+    url, row, error = next(scrape_iter([''], {'p': 'p'}))
+    assert url is None and row is None and error is not None
+
+
+links_page = '''
+<html><head>
+    <base href="/docs/">
+    <meta http-equiv="refresh" content="5; url=next.html">
+    <style>body { background: url(bg.png) }</style>
+</head><body>
+    <a href="a.html">A</a> <a href=" /b.html#x ">B</a> <a href="mailto:x@y.com">mail</a>
+    <img src="img/1.png" style="background: url('2.png')">
+    <form action="post"><button formaction="?go">go</button></form>
+    <object codebase="/java/" data="applet.bin"></object>
+    <p>no links <span>here</span></p>
+</body></html>
+'''
+
+
+@pytest.mark.parametrize('css, xpath', [
+    (None, '//@href'),
+    (None, '//img/@src'),
+    ('a', '@href'),
+    ('a', None),
+    ('body', None),
+    ('img', '@style'),
+    ('meta', '@content'),
+    ('object', '@data'),
+    ('button', '@formaction'),
+    ('style', 'text()'),
+    ('p', './/text()'),
+    (None, 'count(//a)'),
+    (None, 'string(//a/@href)'),
+    (None, 'concat(//a/@href, " ", //img/@src)'),
+    ('a', 'normalize-space(@href)'),
+    (None, '//a/@href = "http://x.com/docs/a.html"'),
+    (None, '//a[contains(@href, "x.com")]/@href'),
+    (None, '//a[starts-with(@href, "http://x.com")]/text()'),
+    ('a[href^="http://x.com"]', None),
+    ('a[href$=".html"]', '@href'),
+    ('img[src*="/docs/img/"]', '@style'),
+    (None, '//a[@href]/@href'),
+])
+def test_lazy_links(css, xpath):
+    base_url = 'http://x.com/start/page.html'
+
+    # What resolving the whole tree up front gives
+    root  = html.make_links_absolute(html.fromstring(links_page), base_url=base_url)
+    eager = _select(root, css, xpath)
+
+    lazy = scrape(links_page, css=css, xpath=xpath, base_url=base_url)
+
+    def plain(matches):
+        if not isinstance(matches, list):
+            return matches
+        return [html.tostring(match) if isinstance(match, html.HtmlElement) else match
+                for match in matches]
+
+    assert plain(lazy) == plain(eager)
+
+
+def test_lazy_links_only_matches():
+    root = html.fromstring(links_page)
+    hrefs = scrape(root, css='a', xpath='@href', base_url='http://x.com/')
+    assert hrefs[0] == 'http://x.com/docs/a.html'
+
+    # Neither the caller's tree nor the links outside the matches are touched
+    assert root.xpath('//a/@href')[0] == 'a.html'
+
+    root, links = _parsed(links_page, 'http://x.com/')
+    _query('a', '@href')(root, links)
+    assert root.xpath('//img/@src') == ['img/1.png']
@@ -0,0 +1,41 @@
+import pytest
+
+from .util import start_server
+
+from scrapetools.fetch import fetch
+from scrapetools.session import SessionPool, get_session
+from scrapetools.util import run
+
+
+@pytest.fixture(scope='module')
+def server():
+    server_process = start_server()
+    yield
+    server_process.terminate()
+
+
+def test_session_reused():
+    async def sessions():
+        return get_session(), get_session()
+
+    a, b = run(sessions())
+    assert a is b
+    assert not a.closed
+
+
+def test_pool(server):
+    pool = SessionPool(limit=10, limit_per_host=2, ttl_dns_cache=10)
+
+    async def main():
+        await pool.prewarm(['http://localhost:5000/home.html',
+                            'http://localhost:5000/index.html',
+                            'malformedurl'])
+        session = pool.session()
+        resps = await fetch(['http://localhost:5000'] * 4, session=session)
+        assert pool.session() is session
+        await pool.close()
+        assert session.closed
+        return resps
+
+    resps = run(main())
+    assert all(r.error is None for r in resps)
@@ -0,0 +1,60 @@
+import pytest
+
+from .util import start_server
+
+from scrapetools.errors import StatusError
+from scrapetools.scrape import scrape
+from scrapetools.shard import fetch_sharded, shard_of
+
+
+local_url = 'http://localhost:5000'
+
+
+@pytest.fixture(scope='module')
+def server():
+    server_process = start_server()
+    yield
+    server_process.terminate()
+
+
+def test_shard_of():
+    assert shard_of('http://a.com/1', 8) == shard_of('http://A.com/2?x', 8)
+    assert len({shard_of(f'http://host{i}.com/', 4) for i in range(100)}) == 4
+
+
+def test_fetch_sharded(server):
+    urls = [f'{local_url}/home.html?{i}' for i in range(250)]
+    urls.append(f'{local_url}/missing.html')
+
+    responses = list(fetch_sharded(urls, workers=2, batch_size=7, parse=len))
+
+    assert sorted(response.url for response in responses) == sorted(urls)
+
+    failed = [response for response in responses if response.error is not None]
+    assert len(failed) == 1
+    assert isinstance(failed[0].error, StatusError)
+    assert failed[0].error.status == 404
+
+    assert all(response.result > 0 for response in responses if response.error is None)
+    assert all(response.timings.status is not None for response in responses)
+
+
+def test_early_stop(server):
+    urls = (f'{local_url}/home.html?{i}' for i in range(10 ** 6))
+
+    responses = fetch_sharded(urls, workers=2, max_concurrent=10)
+    first = [next(responses) for _ in range(20)]
+    responses.close()
+
+    assert len(first) == 20
+
+
+def test_unpicklable_results(server):
+    urls = [f'{local_url}/home.html?{i}' for i in range(5)]
+
+    # lxml elements don't pickle, each response reports it instead of the batch being lost
+    responses = list(fetch_sharded(urls, workers=1, parse=scrape(css='body')))
+
+    assert sorted(response.url for response in responses) == sorted(urls)
+    assert all(isinstance(response.error, TypeError) for response in responses)
+    assert all('picklable' in str(response.error) for response in responses)
@@ -0,0 +1,109 @@
+import pytest
+
+import json
+import base64
+import sqlite3
+import threading
+
+from .util import start_server
+
+from scrapetools.fetch import fetch
+from scrapetools.sink import DirectorySink, JsonLinesSink, SqliteSink, Sink
+from scrapetools.util import run
+
+
+local_url = 'http://localhost:5000'
+
+urls = [
+    f'{local_url}/home.html',
+    f'{local_url}/index.html',
+    f'{local_url}/missing.html',
+]
+
+
+@pytest.fixture(scope='module')
+def server():
+    server_process = start_server()
+    yield
+    server_process.terminate()
+
+
+def test_json_lines(server, tmpdir):
+    path = str(tmpdir.join('pages.jsonl'))
+
+    with JsonLinesSink(path) as sink:
+        summary = run(fetch(urls, sink=sink, max_per_host=2))
+
+    assert summary['requests'] == 3
+    assert summary['errors'] == {'status_404': 1}
+
+    with open(path) as f:
+        lines = {line['url']: line for line in map(json.loads, f)}
+
+    assert set(lines) == set(urls)
+    assert lines[urls[0]]['status'] == 200
+    assert 'home page' in lines[urls[0]]['body'].lower()
+    assert lines[urls[0]]['timings']['bytes'] > 0
+    assert lines[urls[2]]['status'] == 404
+    assert lines[urls[2]]['error'].startswith('StatusError')
+
+
+def test_json_lines_raw(server, tmpdir):
+    path = str(tmpdir.join('pages.jsonl'))
+
+    with JsonLinesSink(path) as sink:
+        run(fetch(urls[:1], sink=sink, raw=True))
+
+    with open(path) as f:
+        line = json.loads(f.readline())
+    assert line['base64']
+    assert b'home page' in base64.b64decode(line['body']).lower()
+
+
+def test_sqlite(server, tmpdir):
+    path = str(tmpdir.join('pages.sqlite'))
+
+    with SqliteSink(path, batch=2) as sink:
+        run(fetch(urls, sink=sink, parse=len))
+
+    rows = sqlite3.connect(path).execute(
+        'SELECT url, status, body, error FROM responses ORDER BY url'
+    ).fetchall()
+    assert len(rows) == 3
+    assert all(isinstance(body, str) and int(body) > 0
+               for url, status, body, error in rows if status == 200)
+
+
+def test_directory(server, tmpdir):
+    path = str(tmpdir.join('pages'))
+
+    with DirectorySink(path) as sink:
+        run(fetch(urls, sink=sink))
+
+    with open(tmpdir.join('pages', 'index.jsonl')) as f:
+        lines = {line['url']: line for line in map(json.loads, f)}
+
+    assert 'file' not in lines[urls[2]]
+    assert lines[urls[0]]['file'].endswith('.html')
+    assert tmpdir.join('pages', lines[urls[0]]['file']).read().lower().count('home page') == 1
+
+
+def test_writes_off_the_loop(server):
+    class Recorder(Sink):
+        def __init__(self):
+            self.threads = set()
+            self.urls    = []
+
+        def write(self, response):
+            self.threads.add(threading.get_ident())
+            self.urls.append(response.url)
+
+    sink = Recorder()
+    run(fetch(urls * 3, sink=sink))
+
+    assert sorted(sink.urls) == sorted(urls * 3)
+    assert threading.get_ident() not in sink.threads
+    assert len(sink.threads) == 1
+
+    with pytest.raises(TypeError):
+        Sink()
@@ -0,0 +1,84 @@
+import pytest
+
+from uuid import uuid4
+
+from .util import start_server
+
+from scrapetools.cache import Cache
+from scrapetools.fetch import fetch
+from scrapetools.retry import Retry
+from scrapetools.timing import Timings
+from scrapetools.util import run
+
+from scrapetools.download import download
+
+
+local_url = 'http://localhost:5000'
+
+
+@pytest.fixture(scope='module')
+def server():
+    server_process = start_server()
+    yield
+    server_process.terminate()
+
+
+def test_timings():
+    timings = Timings()
+    timings.attempt()
+    timings.headers_received(200)
+    timings.body_received(10)
+    timings.finish()
+
+    assert timings.status == 200
+    assert timings.bytes == 10
+    assert timings.retries == 0
+    assert 0 <= timings.ttfb <= timings.total
+    assert timings.as_dict()['transfer'] == timings.transfer
+
+
+def test_fetch_timings(server):
+    response = run(fetch(f'{local_url}/home.html'))
+    timings  = response.timings
+
+    assert timings.status == 200
+    assert timings.bytes == len(response.result.encode('utf-8'))
+    assert timings.retries == 0
+    assert not timings.cached
+    assert timings.ttfb is not None and timings.transfer is not None
+    assert timings.ttfb + timings.transfer <= timings.total
+
+
+def test_fetch_timings_retries(server):
+    url = f'{local_url}/flaky/2/{uuid4().hex}'
+    response = run(fetch(url, retry=Retry(attempts=3)))
+
+    assert response.error is None
+    assert response.timings.retries == 2
+    assert response.timings.status == 200
+
+    response = run(fetch(f'{local_url}/missing.html'))
+    assert response.error is not None
+    assert response.timings.status == 404
+
+
+def test_fetch_timings_cached(tmpdir):
+    cache = Cache(str(tmpdir.join('cache.sqlite')), ttl=60)
+    url = 'http://cached.invalid/'
+    cache.put(url, b'cached', {}, encoding='utf-8')
+
+    response = run(fetch(url, cache=cache, parse=len))
+    assert response.result == 6
+    assert response.timings.cached
+    assert response.timings.attempts == 0
+    cache.close()
+
+
+def test_download_timings(server, tmpdir):
+    path = str(tmpdir.join('lorem.txt'))
+    response = run(download(f'{local_url}/download/lorem.txt', path))
+
+    assert response.result == path
+    assert response.timings.status == 200
+    with open(path, 'rb') as f:
+        assert response.timings.bytes == len(f.read())
@@ -0,0 +1,75 @@
+import pytest
+
+import gzip
+
+from .util import start_server
+
+from scrapetools.errors import StatusError
+from scrapetools.fetch import fetch
+from scrapetools.scrape import scrape
+from scrapetools.util import run
+from scrapetools.warc import WarcWriter, read_warc
+
+
+local_url = 'http://localhost:5000'
+
+urls = [
+    f'{local_url}/home.html',
+    f'{local_url}/list.html',
+    f'{local_url}/missing.html',
+]
+
+
+@pytest.fixture(scope='module')
+def server():
+    server_process = start_server()
+    yield
+    server_process.terminate()
+
+
+def test_round_trip(server, tmpdir):
+    directory = str(tmpdir.join('crawl'))
+
+    with WarcWriter(directory) as warc:
+        fetched = run(fetch(urls, warc=warc))
+
+    archived = {response.url: response for response in read_warc(directory)}
+    assert set(archived) == set(urls)
+
+    for response in fetched[:2]:
+        assert archived[response.url].result == response.result
+
+    error = archived[urls[2]].error
+    assert isinstance(error, StatusError) and error.status == 404
+
+    links = scrape(archived[urls[1]].result, css='li a', xpath='@href')
+    assert len(links) == 200
+
+
+def test_records(server, tmpdir):
+    directory = str(tmpdir.join('crawl'))
+
+    with WarcWriter(directory) as warc:
+        run(fetch(urls[0], warc=warc))
+
+    with gzip.open(warc.paths[0], 'rb') as f:
+        content = f.read()
+
+    assert content.startswith(b'WARC/1.0\r\nWARC-Type: warcinfo\r\n')
+    assert content.count(b'WARC-Type: request\r\n') == 1
+    assert content.count(b'WARC-Type: response\r\n') == 1
+    assert b'GET /home.html HTTP/1.1\r\n' in content
+    assert b'WARC-Payload-Digest: sha1:' in content
+
+
+def test_rolling(server, tmpdir):
+    directory = str(tmpdir.join('crawl'))
+
+    with WarcWriter(directory, max_size=1) as warc:
+        run(fetch(urls[:2], warc=warc))
+
+    assert len(warc.paths) == 2
+
+    archived = list(read_warc(warc.paths, raw=True))
+    assert len(archived) == 2
+    assert all(isinstance(response.result, bytes) for response in archived)
@@ -0,0 +1,76 @@
+import os
+import time
+import asyncio
+
+import pytest
+
+from scrapetools.util import run
+from scrapetools import writer as writer_module
+from scrapetools.writer import FileWriter
+
+
+def test_writer(tmpdir):
+    path = str(tmpdir.join('out.bin'))
+    chunks = [bytes([i]) * 1000 for i in range(50)]
+
+    async def write():
+        async with FileWriter(path, size=60000, buffer_size=4096) as writer:
+            for chunk in chunks:
+                await writer.write(chunk)
+
+    run(write())
+
+    with open(path, 'rb') as fd:
+        assert fd.read() == b''.join(chunks)
+
+
+def test_writer_offsets(tmpdir):
+    path = str(tmpdir.join('out.bin'))
+
+    async def write():
+        first  = FileWriter(path, size=10, offset=0, truncate=False)
+        second = FileWriter(path, size=10, offset=5, truncate=False)
+        async with second:
+            await second.write(b'world')
+        async with first:
+            await first.write(b'hello')
+
+    run(write())
+
+    with open(path, 'rb') as fd:
+        assert fd.read() == b'helloworld'
+    assert os.path.getsize(path) == 10
+
+
+def test_cancelled_close(tmpdir, monkeypatch):
+    path = str(tmpdir.join('out.bin'))
+    pwrite_all = writer_module._pwrite_all
+
+    def slow_pwrite_all(fd, data, offset):
+        time.sleep(0.2)
+        pwrite_all(fd, data, offset)
+
+    monkeypatch.setattr(writer_module, '_pwrite_all', slow_pwrite_all)
+
+    async def write():
+        writer = FileWriter(path)
+        await writer.open()
+        fd = writer._fd
+        await writer.write(b'x' * 100)
+
+        task = asyncio.ensure_future(writer.close())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        # Still open for the write in flight, closed right after it
+        os.fstat(fd)
+        await asyncio.sleep(0.3)
+        with pytest.raises(OSError):
+            os.fstat(fd)
+
+    run(write())
+
+    with open(path, 'rb') as fd:
+        assert fd.read() == b'x' * 100